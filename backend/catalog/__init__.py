@@ -0,0 +1,49 @@
+from typing import Iterable
+
+from .changes import (
+    DELETE, 
+    INSERT, 
+    MENU, 
+    PRODUCT, 
+    SUBCATEGORY, 
+    UPDATE, 
+    catalog_version,
+    catalog_view, 
+    changes_since, 
+    menu_details,
+    record_changes
+)
+from .menus import MenuEntry, MenuIndex, delete_orphan_menus, menu_index
+from .prices import PriceEntry, PriceIndex, price_index
+from .products import (
+    PRODUCT_COLUMNS, 
+    PRODUCT_FIELDS, 
+    product_details
+)
+from .search import SearchEntry, SearchIndex, normalize, search_index
+from .snapshot import Snapshot, SnapshotCache, snapshot_cache
+
+
+def invalidate():
+    """
+    Drop every in-memory view of the catalog: call it after any change
+    to products, menus or subcategories
+    """
+
+    menu_index.invalidate()
+    price_index.invalidate()
+    search_index.invalidate()
+    snapshot_cache.invalidate()
+
+
+async def preload(roles: Iterable[str]):
+    """
+    Build every in-memory view of the catalog, so the first requests
+    after a restart find them ready
+    """
+
+    await menu_index.load()
+    await price_index.load()
+    await search_index.refresh()
+    for x in ["admin", *roles]:
+        await snapshot_cache.get(x)
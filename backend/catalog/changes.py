@@ -0,0 +1,180 @@
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from tortoise import connections
+from tortoise.functions import Max, Min
+from tortoise.transactions import in_transaction
+
+from ..config import Session
+from ..database import (
+    CatalogChange,
+    Menu,
+    MenuProduct,
+    Products,
+    RoleMenu,
+    Subcategories,
+    serialize_writers
+)
+from .products import product_details
+
+
+SUBCATEGORY = "subcategory"
+PRODUCT = "product"
+MENU = "menu"
+
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+# advisory lock of the change log writers
+CHANGES_LOCK = 4242
+
+# entity -> key of the catalog documents
+SECTIONS = {
+    SUBCATEGORY: "subcategories",
+    PRODUCT: "products",
+    MENU: "menus"
+}
+
+
+async def record_changes(entity: str, op: str, ids: Iterable[int]):
+    """
+    Append to the change log, one version per entity changed; a change to
+    a variant, ingredient or role is an update of its product or menu.
+    Call it inside the transaction of the change: the log stays locked
+    for the other writers until it commits
+    """
+
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return
+
+    async with in_transaction():
+        # the versions commit in order: a reader given version v can
+        # never see a smaller one appear later, held by a slower writer
+        await serialize_writers(connections.get("default"), CHANGES_LOCK)
+
+        await CatalogChange.bulk_create([
+            CatalogChange(entity=entity, entity_id=x, op=op) for x in ids
+        ])
+
+        # compaction: the clients behind the kept versions get a snapshot
+        last = await CatalogChange.all().order_by("-id").first().values_list(
+            "id",
+            flat=True
+        )
+        await CatalogChange.filter(
+            id__lte=last - Session.config.CATALOG_CHANGES_KEEP
+        ).delete()
+
+
+async def catalog_version() -> int:
+    last = await CatalogChange.all().order_by("-id").first().values_list(
+        "id",
+        flat=True
+    )
+    return last or 0
+
+
+async def changes_since(since: int) -> Tuple[int, Optional[Dict[str, Set[int]]]]:
+    """
+    The current version and the ids of each entity changed after since,
+    None when the log does not reach back to since
+    """
+
+    bounds = (await CatalogChange.annotate(
+        first=Min("id"),
+        last=Max("id")
+    ).values("first", "last"))[0]
+    first, last = bounds["first"], bounds["last"]
+
+    if last is None or since <= 0 or since > last or since < first - 1:
+        return last or 0, None
+
+    changed = {x: set() for x in SECTIONS}
+    for x in await CatalogChange.filter(
+        id__gt=since,
+        id__lte=last
+    ).values("entity", "entity_id"):
+        changed[x["entity"]].add(x["entity_id"])
+
+    return last, changed
+
+
+async def menu_details(ids: Optional[Iterable[int]] = None) -> Dict[int, dict]:
+    # menus with roles and products, every menu when ids is None
+    if ids is None:
+        menus, roles, products = Menu.all(), RoleMenu.all(), MenuProduct.all()
+    else:
+        ids = list(ids)
+        menus = Menu.filter(id__in=ids)
+        roles = RoleMenu.filter(menu_id__in=ids)
+        products = MenuProduct.filter(menu_id__in=ids)
+
+    menus = {
+        x["id"]: {**x, "roles": [], "products": []}
+        for x in await menus.order_by("id").values("id", "name")
+    }
+
+    for x in await roles.values("menu_id", "role"):
+        menus[x["menu_id"]]["roles"].append(x["role"])
+    for x in await products.order_by("id").values(
+        "menu_id",
+        "product_id",
+        "optional"
+    ):
+        menus[x.pop("menu_id")]["products"].append(x)
+
+    return menus
+
+
+async def catalog_view(
+    role: str,
+    changed: Optional[Dict[str, Iterable[int]]] = None
+) -> Dict[str, Dict[str, list]]:
+    """
+    What a role sees of the catalog, for each section the entities to
+    insert or update and the ids to delete: everything when changed is
+    None, else only the changed ids. Products and menus the role can no
+    longer see are deletes. The stocks are given as sold_out only
+    """
+
+    if changed is None:
+        subcategories = Subcategories.all()
+        products = await Products.all().values_list("id", flat=True)
+        menus = None
+    else:
+        subcategories = Subcategories.filter(id__in=list(changed[SUBCATEGORY]))
+        products = changed[PRODUCT]
+        menus = changed[MENU]
+
+    entities = {
+        SUBCATEGORY: {
+            x["id"]: x
+            for x in await subcategories.order_by("order").values()
+        },
+        PRODUCT: await product_details(products, roles=True),
+        MENU: await menu_details(menus)
+    }
+
+    # sold_out only: a count would change with every order, and an order
+    # logs a change only when a stock reaches 0
+    for x in entities[PRODUCT].values():
+        del x["stock"]
+        for y in x["ingredient"]:
+            del y["stock"]
+
+    if role != "admin":
+        for entity in (PRODUCT, MENU):
+            for x, data in list(entities[entity].items()):
+                if role not in data.pop("roles"):
+                    del entities[entity][x]
+
+    view = {}
+    for entity, section in SECTIONS.items():
+        ids: Set[int] = set() if changed is None else set(changed[entity])
+        view[section] = {
+            "upsert": list(entities[entity].values()),
+            "delete": sorted(ids - set(entities[entity]))
+        }
+
+    return view
@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+from tortoise.expressions import Subquery
+
+from ..database import Menu, MenuProduct, RoleMenu
+from ..utils.metrics import record_cache
+
+
+@dataclass(frozen=True)
+class MenuEntry:
+    required: FrozenSet[int]
+    # required and optional products
+    allowed: FrozenSet[int]
+    roles: FrozenSet[str]
+
+
+class MenuIndex:
+    """
+    Composition of every menu, loaded once and kept until the catalog
+    changes, so an order line is validated with set operations only
+    """
+
+    def __init__(self):
+        self._menus: Optional[Dict[int, MenuEntry]] = None
+        self._generation = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._menus = None
+
+    async def load(self) -> Dict[int, MenuEntry]:
+        generation = self._generation
+
+        required = {x: set() for x in await Menu.all().values_list("id", flat=True)}
+        allowed = {x: set() for x in required}
+        roles = {x: set() for x in required}
+
+        for x in await MenuProduct.all().values("menu_id", "product_id", "optional"):
+            allowed[x["menu_id"]].add(x["product_id"])
+            if not x["optional"]:
+                required[x["menu_id"]].add(x["product_id"])
+
+        for x in await RoleMenu.all().values("menu_id", "role"):
+            roles[x["menu_id"]].add(x["role"])
+
+        menus = {
+            x: MenuEntry(
+                required=frozenset(required[x]),
+                allowed=frozenset(allowed[x]),
+                roles=frozenset(roles[x])
+            )
+            for x in required
+        }
+
+        # a change during the load makes the result stale
+        if generation == self._generation:
+            self._menus = menus
+
+        return menus
+
+    async def menus(self) -> Dict[int, MenuEntry]:
+        menus = self._menus
+        record_cache("menu_index", menus is not None)
+
+        if menus is None:
+            menus = await self.load()
+
+        return menus
+
+    async def get(self, menu_id: int) -> Optional[MenuEntry]:
+        return (await self.menus()).get(menu_id)
+
+
+menu_index = MenuIndex()
+
+
+async def delete_orphan_menus(
+    products: Union[Iterable[int], Subquery]
+) -> Tuple[List[int], List[int]]:
+    """
+    Delete, with one statement, the menus made only of the given products,
+    i.e. the menus left empty once the products are deleted. Returns the
+    deleted menus and the menus that only lose some products
+    """
+
+    if not isinstance(products, Subquery):
+        products = list(products)
+
+    menus = Menu.filter(
+        id__in=Subquery(
+            MenuProduct.filter(product_id__in=products).values("menu_id")
+        )
+    )
+    orphans = menus.exclude(
+        id__in=Subquery(
+            MenuProduct.exclude(product_id__in=products).values("menu_id")
+        )
+    )
+
+    # the ids are for the change log, the delete stays set-based
+    touched = await menus.values_list("id", flat=True)
+    deleted = await orphans.values_list("id", flat=True)
+    await orphans.delete()
+
+    return sorted(deleted), sorted(set(touched) - set(deleted))
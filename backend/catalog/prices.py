@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from ..database import Ingredients, Products, RoleProduct, Variant
+from ..utils.metrics import record_cache
+
+
+@dataclass(frozen=True)
+class PriceEntry:
+    name: str
+    price: float
+    roles: FrozenSet[str]
+    # id -> (name, price)
+    variants: Dict[int, Tuple[str, float]]
+    ingredients: Dict[int, Tuple[str, float]]
+
+
+class PriceIndex:
+    """
+    Prices of every product with its variants and ingredients, loaded
+    once and kept until the catalog changes, so a quote needs no query
+    """
+
+    def __init__(self):
+        self._products: Optional[Dict[int, PriceEntry]] = None
+        self._generation = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._products = None
+
+    async def load(self) -> Dict[int, PriceEntry]:
+        generation = self._generation
+
+        rows = await Products.all().values("id", "name", "price")
+        variants = {x["id"]: {} for x in rows}
+        ingredients = {x["id"]: {} for x in rows}
+        roles = {x["id"]: set() for x in rows}
+
+        for x in await Variant.all().values("id", "name", "price", "product_id"):
+            variants[x["product_id"]][x["id"]] = (x["name"], x["price"])
+
+        for x in await Ingredients.all().values("id", "name", "price", "product_id"):
+            ingredients[x["product_id"]][x["id"]] = (x["name"], x["price"])
+
+        for x in await RoleProduct.all().values("product_id", "role"):
+            roles[x["product_id"]].add(x["role"])
+
+        products = {
+            x["id"]: PriceEntry(
+                name=x["name"],
+                price=x["price"],
+                roles=frozenset(roles[x["id"]]),
+                variants=variants[x["id"]],
+                ingredients=ingredients[x["id"]]
+            )
+            for x in rows
+        }
+
+        # a change during the load makes the result stale
+        if generation == self._generation:
+            self._products = products
+
+        return products
+
+    async def products(self) -> Dict[int, PriceEntry]:
+        products = self._products
+        record_cache("price_index", products is not None)
+
+        if products is None:
+            products = await self.load()
+
+        return products
+
+
+price_index = PriceIndex()
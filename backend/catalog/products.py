@@ -0,0 +1,67 @@
+from typing import Dict, Iterable, Optional, Sequence
+
+from ..database import Ingredients, Products, RoleProduct, Variant
+
+
+PRODUCT_COLUMNS = (
+    "id", 
+    "name", 
+    "price", 
+    "category", 
+    "subcategory_id", 
+    "stock"
+)
+PRODUCT_RELATIONS = ("variant", "ingredient", "roles")
+PRODUCT_FIELDS = PRODUCT_COLUMNS + PRODUCT_RELATIONS
+
+
+async def product_details(
+    ids: Iterable[int], 
+    roles: bool = False,
+    fields: Optional[Sequence[str]] = None
+) -> Dict[int, dict]:
+    """
+    Products with their variants and ingredients (and roles if asked),
+    loaded with one query per table whatever the number of products.
+    fields restricts the columns and relations that are read
+    """
+
+    ids = list(set(ids))
+    if not ids:
+        return {}
+
+    fields = PRODUCT_FIELDS if fields is None else fields
+    columns = [x for x in PRODUCT_COLUMNS if x in fields]
+
+    products = {
+        x["id"]: x
+        for x in await Products.filter(id__in=ids).values(
+            *dict.fromkeys(["id"] + columns)
+        )
+    }
+    for x in products.values():
+        if "id" not in fields:
+            del x["id"]
+        if "stock" in fields:
+            x["sold_out"] = x["stock"] == 0
+
+    if "variant" in fields:
+        for x in products.values():
+            x["variant"] = []
+        for x in await Variant.filter(product_id__in=ids).values():
+            products[x["product_id"]]["variant"].append(x)
+
+    if "ingredient" in fields:
+        for x in products.values():
+            x["ingredient"] = []
+        for x in await Ingredients.filter(product_id__in=ids).values():
+            x["sold_out"] = x["stock"] == 0
+            products[x["product_id"]]["ingredient"].append(x)
+
+    if roles:
+        for x in products.values():
+            x["roles"] = []
+        for x in await RoleProduct.filter(product_id__in=ids).values():
+            products[x["product_id"]]["roles"].append(x["role"])
+
+    return products
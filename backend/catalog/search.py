@@ -0,0 +1,174 @@
+import unicodedata
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from ..database import Menu, Products, RoleMenu, RoleProduct
+from ..utils.metrics import record_cache
+from .changes import MENU, PRODUCT, changes_since
+
+
+def normalize(text: str) -> str:
+    # "Ragù " and "ragu" compare equal: no accents, no case, one space
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(x for x in text if not unicodedata.combining(x))
+    return " ".join(text.casefold().split())
+
+
+@dataclass(frozen=True)
+class SearchEntry:
+    kind: str
+    id: int
+    name: str
+    roles: FrozenSet[str]
+    # the normalized name from each word on, so "ragu" finds "pasta al ragù"
+    keys: Tuple[str, ...]
+
+
+def _entry(
+    kind: str,
+    entity_id: int,
+    name: str,
+    roles: Iterable[str]
+) -> SearchEntry:
+    words = normalize(name).split(" ")
+
+    return SearchEntry(
+        kind=kind,
+        id=entity_id,
+        name=name,
+        roles=frozenset(roles),
+        keys=tuple(" ".join(words[x:]) for x in range(len(words)))
+    )
+
+
+class SearchIndex:
+    """
+    Prefix index over product and menu names: a sorted array of
+    (key, kind, id) searched with bisect. catalog.invalidate() only marks
+    it stale, the next search applies the changes logged since the index
+    version instead of reloading everything
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[str, str, int]] = []
+        self._entries: Optional[Dict[Tuple[str, int], SearchEntry]] = None
+        self._version = 0
+        self._stale = True
+        self._generation = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._stale = True
+
+    def _add(self, entry: SearchEntry):
+        self._entries[(entry.kind, entry.id)] = entry
+        for x in entry.keys:
+            insort(self._keys, (x, entry.kind, entry.id))
+
+    def _remove(self, kind: str, entity_id: int):
+        entry = self._entries.pop((kind, entity_id), None)
+        if entry is None:
+            return
+
+        for x in entry.keys:
+            del self._keys[bisect_left(self._keys, (x, kind, entity_id))]
+
+    async def _load(
+        self,
+        products: Optional[List[int]] = None,
+        menus: Optional[List[int]] = None
+    ) -> List[SearchEntry]:
+        # every product and menu when the ids are None
+        entries = []
+
+        for kind, model, roles_model, ids in (
+            (PRODUCT, Products, RoleProduct, products),
+            (MENU, Menu, RoleMenu, menus),
+        ):
+            key = "product_id" if kind == PRODUCT else "menu_id"
+
+            if ids is None:
+                rows, grants = model.all(), roles_model.all()
+            elif ids:
+                rows = model.filter(id__in=ids)
+                grants = roles_model.filter(**{f"{key}__in": ids})
+            else:
+                continue
+
+            names = dict(await rows.values_list("id", "name"))
+            roles = {x: [] for x in names}
+            for x, role in await grants.values_list(key, "role"):
+                if x in roles:
+                    roles[x].append(role)
+
+            entries.extend(
+                _entry(kind, x, name, roles[x]) for x, name in names.items()
+            )
+
+        return entries
+
+    async def refresh(self):
+        generation = self._generation
+        version, changed = await changes_since(self._version)
+
+        if self._entries is None or changed is None:
+            entries = await self._load()
+            if generation != self._generation:
+                return
+
+            self._keys = []
+            self._entries = {}
+            for x in entries:
+                self._entries[(x.kind, x.id)] = x
+                self._keys.extend((y, x.kind, x.id) for y in x.keys)
+            self._keys.sort()
+        else:
+            entries = await self._load(
+                products=list(changed[PRODUCT]),
+                menus=list(changed[MENU])
+            )
+            if generation != self._generation:
+                return
+
+            for kind in (PRODUCT, MENU):
+                for x in changed[kind]:
+                    self._remove(kind, x)
+            for x in entries:
+                self._add(x)
+
+        self._version = version
+        self._stale = False
+
+    async def search(self, q: str, role: str, limit: int = 10) -> List[dict]:
+        record_cache("search_index", not self._stale)
+        if self._stale:
+            await self.refresh()
+
+        prefix = normalize(q)
+        if not prefix:
+            return []
+
+        result, seen = [], set()
+        i = bisect_left(self._keys, (prefix,))
+
+        while i < len(self._keys) and len(result) < limit:
+            key, kind, entity_id = self._keys[i]
+            if not key.startswith(prefix):
+                break
+            i += 1
+
+            entry = self._entries[(kind, entity_id)]
+            if (
+                entry in seen or
+                (role != "admin" and role not in entry.roles)
+            ):
+                continue
+
+            seen.add(entry)
+            result.append({"type": kind, "id": entity_id, "name": entry.name})
+
+        return result
+
+
+search_index = SearchIndex()
@@ -0,0 +1,132 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List
+from urllib.parse import quote
+
+import msgpack
+
+from ..utils.metrics import record_cache
+from .changes import catalog_version, catalog_view
+
+
+# positional rows: the names are sent once in "fields"
+FIELDS = {
+    "subcategories": ["id", "name", "order"],
+    "products": [
+        "id",
+        "name",
+        "price",
+        "category",
+        "subcategory_id",
+        "sold_out",
+        "variant",
+        "ingredient"
+    ],
+    "variant": ["id", "name", "price"],
+    "ingredient": ["id", "name", "price", "sold_out"],
+    "menus": ["id", "name", "products"],
+    "menu_products": ["product_id", "optional"],
+}
+
+
+class _Strings:
+    # every string once in a table, the rows hold its index
+    def __init__(self):
+        self.table: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def __call__(self, value: str) -> int:
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.table)
+            self.table.append(value)
+        return index
+
+
+def encode(version: int, role: str, view: Dict[str, Dict[str, list]]) -> bytes:
+    s = _Strings()
+
+    subcategories = [
+        [x["id"], s(x["name"]), x["order"]]
+        for x in view["subcategories"]["upsert"]
+    ]
+    products = [
+        [
+            x["id"],
+            s(x["name"]),
+            x["price"],
+            s(x["category"].value),
+            x["subcategory_id"],
+            x["sold_out"],
+            [[y["id"], s(y["name"]), y["price"]] for y in x["variant"]],
+            [
+                [y["id"], s(y["name"]), y["price"], y["sold_out"]]
+                for y in x["ingredient"]
+            ]
+        ]
+        for x in view["products"]["upsert"]
+    ]
+    menus = [
+        [
+            x["id"],
+            s(x["name"]),
+            [[y["product_id"], y["optional"]] for y in x["products"]]
+        ]
+        for x in view["menus"]["upsert"]
+    ]
+
+    return msgpack.packb({
+        "version": version,
+        "role": role,
+        "fields": FIELDS,
+        "strings": s.table,
+        "subcategories": subcategories,
+        "products": products,
+        "menus": menus
+    })
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int
+    etag: str
+    data: bytes
+
+
+class SnapshotCache:
+    """
+    The role-filtered catalog as MessagePack, built once per catalog
+    version and role and then served from memory
+    """
+
+    def __init__(self):
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def invalidate(self):
+        self._snapshots.clear()
+
+    async def get(self, role: str) -> Snapshot:
+        version = await catalog_version()
+
+        snapshot = self._snapshots.get(role)
+        hit = snapshot is not None and snapshot.version == version
+        record_cache("catalog_snapshot", hit)
+        if hit:
+            return snapshot
+
+        # one build per role, the other requests wait for it
+        async with self._locks.setdefault(role, asyncio.Lock()):
+            snapshot = self._snapshots.get(role)
+            if snapshot is None or snapshot.version != version:
+                data = encode(version, role, await catalog_view(role))
+                snapshot = self._snapshots[role] = Snapshot(
+                    version=version,
+                    etag=f'"{version}-{quote(role)}"',
+                    data=data
+                )
+
+        return snapshot
+
+
+snapshot_cache = SnapshotCache()
@@ -1,30 +1,91 @@
 from asyncio import Lock
+from typing import Union
 
 from pydantic import BaseSettings
 
 
 LIST_ENV = [
+    "DB_URL",
     "DB_USERNAME",
     "PASSWORD",
     "HOST",
     "PORT",
     "DB_NAME",
+    "DB_POOL_MIN_SIZE",
+    "DB_POOL_MAX_SIZE",
     "JWT_SECRET",
     "JWT_TOKEN_EXPIRES",
+    "JWT_REFRESH_EXPIRES",
+    "SESSION_CACHE_TTL",
+    "ARGON2_TIME_COST",
+    "ARGON2_MEMORY_COST",
+    "ARGON2_PARALLELISM",
+    "QUERY_DEBUG",
+    "METRICS_TOKEN",
+    "ORDERS_CONCURRENCY",
+    "ORDERS_QUEUE",
+    "PASSWORDS_CONCURRENCY",
+    "PASSWORDS_QUEUE",
+    "READS_CONCURRENCY",
+    "READS_QUEUE",
+    "ADMISSION_RETRY_AFTER",
+    "BATCH_MAX_SIZE",
+    "CATALOG_CHANGES_KEEP",
+    "USERS_PAGE_SIZE",
+    "COUNT_CACHE_TTL",
 ]
 
 
 class Config(BaseSettings):
-    # db
-    DB_USERNAME: str
-    PASSWORD: str
-    HOST: str
+    # db: DB_URL (e.g. sqlite://festival.sqlite3) or the postgres settings
+    DB_URL: str = ""
+    DB_USERNAME: str = ""
+    PASSWORD: str = ""
+    HOST: str = "localhost"
     PORT: str = "5432"
-    DB_NAME: str
+    DB_NAME: str = ""
+    # postgres pool, the min size connections are opened at startup
+    DB_POOL_MIN_SIZE: int = 1
+    DB_POOL_MAX_SIZE: int = 5
 
     # token jwt
     JWT_SECRET: str
     JWT_TOKEN_EXPIRES: int
+    # refresh token, renewed at each use
+    JWT_REFRESH_EXPIRES: int = 7 * 24 * 3600
+    # seconds a session is trusted without checking its revocation
+    SESSION_CACHE_TTL: float = 30
+
+    # argon2, pick them with python -m backend.utils.calibrate
+    ARGON2_TIME_COST: int = 3
+    # KiB
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+
+    # debug: record the queries of each request
+    QUERY_DEBUG: bool = False
+
+    # bearer token of the prometheus scraper on /metrics, empty: admin only
+    METRICS_TOKEN: str = ""
+
+    # admission control: running requests and waiting queue per class
+    ORDERS_CONCURRENCY: int = 8
+    ORDERS_QUEUE: int = 64
+    PASSWORDS_CONCURRENCY: int = 2
+    PASSWORDS_QUEUE: int = 16
+    READS_CONCURRENCY: int = 16
+    READS_QUEUE: int = 128
+    ADMISSION_RETRY_AFTER: float = 1
+
+    # max ids of a batch request
+    BATCH_MAX_SIZE: int = 100
+
+    # catalog versions kept for delta sync, older clients get a snapshot
+    CATALOG_CHANGES_KEEP: int = 1000
+
+    # users list: default page size and seconds the total is cached
+    USERS_PAGE_SIZE: int = 10
+    COUNT_CACHE_TTL: float = 60
 
     # look
     LOCK = Lock()
@@ -36,6 +97,23 @@ class Config(BaseSettings):
         "punto giovani"
     ]
     
+    @property
+    def db(self) -> Union[str, dict]:
+        # DB_URL, or the postgres connection as given: no url to escape
+        if self.DB_URL:
+            return self.DB_URL
+
+        return {
+            "engine": "tortoise.backends.asyncpg",
+            "credentials": {
+                "host": self.HOST,
+                "port": int(self.PORT),
+                "user": self.DB_USERNAME,
+                "password": self.PASSWORD,
+                "database": self.DB_NAME,
+            }
+        }
+    
     class Config:
         case_sensitive = True
 
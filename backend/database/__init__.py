@@ -1,6 +1,8 @@
 __all__ = (
+    "CatalogChange",
     "IngredientOrder", 
     "Ingredients", 
+    "LoginSession",
     "Menu", 
     "MenuOrder",
     "MenuProduct", 
@@ -11,17 +13,38 @@ __all__ = (
     "RoleProduct", 
     "Subcategories", 
     "Users", 
-    "Variant"
+    "Variant",
+    "QueryBudgetExceeded",
+    "QueryLogMiddleware",
+    "QueryRecorder",
+    "add_query_listener",
+    "remove_query_listener",
+    "init_db",
+    "open_pool",
+    "serialize_writers",
+    "tortoise_config",
+    "upgrade_schema"
 )
 
 
+from typing import Union
+
 from fastapi import FastAPI
+from tortoise import connections
 from tortoise.contrib.fastapi import register_tortoise
 
 from ..config import Session
+from .dialect import connection_config, serialize_writers, upgrade_schema
+from .instrument import (
+    add_query_listener, 
+    instrument_clients, 
+    remove_query_listener
+)
 from .models import (
+    CatalogChange,
     IngredientOrder, 
     Ingredients, 
+    LoginSession,
     Menu, 
     MenuOrder,
     MenuProduct, 
@@ -34,6 +57,28 @@ from .models import (
     Users, 
     Variant
 )
+from .recorder import QueryBudgetExceeded, QueryLogMiddleware, QueryRecorder
+
+
+def tortoise_config(
+    db: Union[str, dict],
+    pool_min_size: int = 1,
+    pool_max_size: int = 5
+) -> dict:
+    return {
+        "connections": {
+            "default": connection_config(db, pool_min_size, pool_max_size)
+        },
+        "apps": {
+            "models": {
+                "models": [
+                    "backend.database.models",
+                ],
+                "default_connection": "default",
+            }
+        },
+        "timezone": "Europe/Rome"
+    }
 
 
 def init_db(app: FastAPI):
@@ -41,28 +86,24 @@ def init_db(app: FastAPI):
 
     register_tortoise(
         app,
-        config={
-            "connections": {
-                "default": {
-                    "engine": "tortoise.backends.asyncpg",
-                    "credentials": {
-                        "host": conf.HOST,
-                        "port": conf.PORT,
-                        "user": conf.DB_USERNAME,
-                        "password": conf.PASSWORD,
-                        "database": conf.DB_NAME,
-                    }
-                }
-            },
-            "apps": {
-                "models": {
-                    "models": [
-                        "backend.database.models",
-                    ],
-                    "default_connection": "default",
-                }
-            },
-            "timezone": "Europe/Rome"
-        },
+        config=tortoise_config(
+            conf.db,
+            conf.DB_POOL_MIN_SIZE,
+            conf.DB_POOL_MAX_SIZE
+        ),
+        # CREATE TABLE IF NOT EXISTS: only the missing tables are created
         generate_schemas=True
     )
+
+    # after register_tortoise: the tables and the client classes exist
+    app.add_event_handler("startup", upgrade_db)
+    app.add_event_handler("startup", instrument_clients)
+
+
+async def upgrade_db():
+    await upgrade_schema(connections.get("default"))
+
+
+async def open_pool():
+    # the pool is created by the first query, with its min size connections
+    await connections.get("default").execute_query("SELECT 1")
@@ -0,0 +1,93 @@
+"""
+Engine specific settings. Anything that only works on one database
+(pragmas, pool options, raw SQL) belongs here, the rest of the backend
+only uses the ORM.
+"""
+
+from copy import deepcopy
+from typing import Union
+
+from tortoise.backends.base.config_generator import expand_db_url
+
+
+SQLITE = "sqlite"
+POSTGRES = "postgres"
+
+ENGINES = {
+    "tortoise.backends.sqlite": SQLITE,
+    "tortoise.backends.asyncpg": POSTGRES,
+}
+
+# WAL lets the tills read while an order is being written, NORMAL is
+# durable enough in WAL mode and avoids an fsync per transaction
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+}
+
+
+def connection_config(
+    db: Union[str, dict],
+    pool_min_size: int = 1,
+    pool_max_size: int = 5
+) -> dict:
+    # db: a url, or a connection dict with engine and credentials
+    if isinstance(db, str):
+        config = expand_db_url(db)
+    else:
+        config = deepcopy(db)
+
+    if ENGINES.get(config["engine"]) is None:
+        raise ValueError(f"Unsupported database: {config['engine']}")
+
+    if ENGINES[config["engine"]] == SQLITE:
+        for pragma, value in SQLITE_PRAGMAS.items():
+            config["credentials"].setdefault(pragma, value)
+
+    # asyncpg opens minsize connections when the pool is created
+    if ENGINES[config["engine"]] == POSTGRES:
+        config["credentials"].setdefault("minsize", pool_min_size)
+        config["credentials"].setdefault("maxsize", pool_max_size)
+
+    return config
+
+
+def dialect(db_url: str) -> str:
+    return ENGINES[expand_db_url(db_url)["engine"]]
+
+
+async def serialize_writers(connection, key: int):
+    """
+    Make the transactions that write a table take turns until they
+    commit, so its auto-increment ids become visible in order. Postgres:
+    a transaction-level advisory lock on key. SQLite has one writer at a
+    time already
+    """
+
+    if connection.capabilities.dialect == POSTGRES:
+        await connection.execute_query("SELECT pg_advisory_xact_lock($1)", [key])
+
+
+# columns added to tables that existed already: generate_schemas only
+# creates the missing tables
+COLUMNS = [
+    ("products", "stock", "INT NULL"),
+    ("ingredients", "stock", "INT NULL"),
+]
+
+
+async def upgrade_schema(connection):
+    for table, column, definition in COLUMNS:
+        if connection.capabilities.dialect == POSTGRES:
+            await connection.execute_script(
+                f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{column}" {definition}'
+            )
+            continue
+
+        # SQLite has no ADD COLUMN IF NOT EXISTS
+        _, rows = await connection.execute_query(f'PRAGMA table_info("{table}")')
+        if column not in [row["name"] for row in rows]:
+            await connection.execute_script(
+                f'ALTER TABLE "{table}" ADD COLUMN "{column}" {definition}'
+            )
@@ -0,0 +1,60 @@
+import time
+from functools import wraps
+from typing import Callable, List
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+
+METHODS = (
+    "execute_insert", 
+    "execute_many", 
+    "execute_query", 
+    "execute_query_dict"
+)
+
+_listeners: List[Callable[[str, float], None]] = []
+
+
+def add_query_listener(listener: Callable[[str, float], None]):
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_query_listener(listener: Callable[[str, float], None]):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def _wrap(func):
+    @wraps(func)
+    async def wrapper(self, query, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(self, query, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            for listener in _listeners:
+                listener(query, elapsed)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def _subclasses(cls):
+    for x in cls.__subclasses__():
+        yield x
+        yield from _subclasses(x)
+
+
+def instrument_clients():
+    """
+    Wrap the execute methods of every loaded Tortoise client (and its 
+    transaction wrappers) so that listeners see each statement
+    """
+
+    for cls in _subclasses(BaseDBAsyncClient):
+        for name in METHODS:
+            func = cls.__dict__.get(name)
+            if func is None or getattr(func, "__instrumented__", False):
+                continue
+            setattr(cls, name, _wrap(func))
@@ -33,6 +33,8 @@ class Ingredients(Model):
     name = fields.CharField(20)
     price = fields.FloatField()
     product = fields.ForeignKeyField("models.Products")
+    # null: not tracked
+    stock = fields.IntField(null=True)
 
     class Meta:
         table = "ingredients"
@@ -59,6 +61,8 @@ class Products(Model):
     price = fields.FloatField()
     category = fields.CharEnumField(Category)
     subcategory = fields.ForeignKeyField("models.Subcategories")
+    # null: not tracked
+    stock = fields.IntField(null=True)
 
     class Meta:
         table = "products"
@@ -178,3 +182,32 @@ class MenuProduct(Model):
 
     class Meta:
         table = "menu_product"
+
+
+class CatalogChange(Model):
+    """
+    The CatalogChange model: the id is the catalog version
+    """
+
+    entity = fields.CharField(20)
+    entity_id = fields.IntField()
+    op = fields.CharField(6)
+    time = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "catalog_change"
+
+
+class LoginSession(Model):
+    """
+    The LoginSession model: jti is the id of the last refresh token
+    """
+
+    user = fields.ForeignKeyField("models.Users")
+    jti = fields.CharField(32, unique=True)
+    expires = fields.DatetimeField()
+    revoked = fields.BooleanField(default=False)
+    time = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "login_session"
@@ -0,0 +1,142 @@
+import logging
+import re
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from .instrument import add_query_listener
+
+
+log = logging.getLogger("festival.queries")
+
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_PARAM = re.compile(r"\$\d+|\?")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_LIST = re.compile(r"\((?:\s*\?\s*,)*\s*\?\s*\)")
+_RE_SPACE = re.compile(r"\s+")
+
+
+def normalize(query: str) -> str:
+    """
+    Reduce a statement to its shape: literals and placeholders become ?
+    and IN lists collapse, so the same query with other ids compares equal
+    """
+
+    query = _RE_STRING.sub("?", query)
+    query = _RE_PARAM.sub("?", query)
+    query = _RE_NUMBER.sub("?", query)
+    query = _RE_LIST.sub("(...)", query)
+    return _RE_SPACE.sub(" ", query).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+_active: ContextVar[Tuple["QueryRecorder", ...]] = ContextVar(
+    "query_recorders",
+    default=()
+)
+
+
+def _listener(query: str, elapsed: float):
+    for recorder in _active.get():
+        recorder.queries.append((query, elapsed))
+
+
+class QueryRecorder:
+    """
+    Records every statement issued in the current context (and in the
+    tasks it spawns), e.g. around a request made with a test client:
+
+        with QueryRecorder() as rec:
+            await client.post("/orders/", ...)
+        rec.assert_budget(12, max_repeats=2)
+    """
+
+    def __init__(self):
+        self.queries: List[Tuple[str, float]] = []
+        self._token = None
+
+    def __enter__(self):
+        add_query_listener(_listener)
+        self._token = _active.set(_active.get() + (self,))
+        return self
+
+    def __exit__(self, *args):
+        _active.reset(self._token)
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def time(self) -> float:
+        return sum(x[1] for x in self.queries)
+
+    def shapes(self) -> Counter:
+        return Counter(normalize(x[0]) for x in self.queries)
+
+    def repeated(self, threshold: int = 2) -> List[Tuple[str, int]]:
+        return [x for x in self.shapes().most_common() if x[1] >= threshold]
+
+    def report(self, threshold: int = 2) -> str:
+        lines = [f"{self.count} queries in {self.time * 1000:.2f} ms"]
+        repeated = self.repeated(threshold)
+
+        if repeated:
+            lines.append("repeated statements (possible N+1):")
+            lines.extend(f"  {n} x {shape}" for shape, n in repeated)
+
+        return "\n".join(lines)
+
+    def assert_budget(self, budget: int, max_repeats: Optional[int] = None):
+        if self.count > budget:
+            raise QueryBudgetExceeded(
+                f"query budget exceeded: {self.count} > {budget}\n"
+                + self.report()
+            )
+
+        if max_repeats is not None:
+            repeated = self.repeated(max_repeats + 1)
+            if repeated:
+                raise QueryBudgetExceeded(
+                    f"statement repeated more than {max_repeats} times\n"
+                    + self.report(max_repeats + 1)
+                )
+
+
+class QueryLogMiddleware:
+    """
+    Debug mode: records the statements of each request, exposes the count
+    in the X-Query-Count header and logs the requests with repeated shapes
+    """
+
+    def __init__(self, app, threshold: int = 3):
+        self.app = app
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        recorder = QueryRecorder()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-query-count", str(recorder.count).encode()),
+                ]
+            await send(message)
+
+        with recorder:
+            await self.app(scope, receive, send_wrapper)
+
+        if recorder.repeated(self.threshold):
+            log.warning(
+                "%s %s: %s",
+                scope["method"],
+                scope["path"],
+                recorder.report(self.threshold)
+            )
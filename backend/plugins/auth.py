@@ -1,21 +1,34 @@
+import asyncio
 import datetime
 import string
+import uuid
 
 import jwt
-from argon2 import PasswordHasher
 from argon2.exceptions import (
     HashingError, 
     InvalidHash, 
     VerificationError,
     VerifyMismatchError
 )
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends
 from pydantic import BaseModel
 from tortoise.exceptions import IntegrityError
 
 from ..config import Session
-from ..database import Users
-from ..utils import TokenJwt, UnicornException, roles, token_jwt
+from ..database import LoginSession, Users
+from ..utils import (
+    TokenJwt, 
+    UnicornException, 
+    admission, 
+    hash_password, 
+    needs_rehash,
+    refresh_token,
+    roles, 
+    session_cache,
+    token_jwt, 
+    user_count,
+    verify_password
+)
 from ..utils.enums import Roles
 
 
@@ -25,10 +38,86 @@ router = APIRouter(
 )
 
 
-@router.get("/")
+def session_expires() -> datetime.datetime:
+    return (
+        datetime.datetime.now(tz=datetime.timezone.utc) + 
+        datetime.timedelta(seconds=Session.config.JWT_REFRESH_EXPIRES)
+    )
+
+
+def session_tokens(
+    sid: int,
+    jti: str,
+    user_id: int,
+    username: str,
+    role: str,
+    expires: datetime.datetime
+) -> dict:
+    exp = (
+        datetime.datetime.now(tz=datetime.timezone.utc) + 
+        datetime.timedelta(seconds=Session.config.JWT_TOKEN_EXPIRES)
+    )
+
+    claims = {"id": user_id, "username": username, "role": role, "sid": sid}
+
+    token = jwt.encode(
+        {**claims, "exp": exp, "type": "access", "jti": uuid.uuid4().hex},
+        Session.config.JWT_SECRET,
+        algorithm="HS256"
+    )
+    refresh = jwt.encode(
+        {**claims, "exp": expires, "type": "refresh", "jti": jti},
+        Session.config.JWT_SECRET,
+        algorithm="HS256"
+    )
+
+    return {
+        "error": False,
+        "message": "",
+        "token": token,
+        "refresh_token": refresh
+    }
+
+
+async def open_session(user_id: int, username: str, role: str) -> dict:
+    session = await LoginSession.create(
+        user_id=user_id,
+        jti=uuid.uuid4().hex,
+        expires=session_expires()
+    )
+    session_cache.add(session.id)
+
+    return session_tokens(
+        session.id,
+        session.jti,
+        user_id,
+        username,
+        role,
+        session.expires
+    )
+
+
+# one rehash at a time, on top of the passwords limiter
+_rehash = asyncio.Semaphore(1)
+
+
+async def rehash_password(user_id: int, hash: str, password: str):
+    # while one runs the others are skipped: a later login retries them
+    if _rehash.locked():
+        return
+
+    async with _rehash:
+        # skipped if the password changed meanwhile
+        await Users.filter(id=user_id, password=hash).update(
+            password=await hash_password(password)
+        )
+
+
+@router.get("/", dependencies=[Depends(admission.passwords)])
 async def login(
     username: str,
-    password: str
+    password: str,
+    background: BackgroundTasks
 ):
     user = await Users.get_or_none(username=username).values()
 
@@ -39,8 +128,7 @@ async def login(
         )
     
     try:
-        ph = PasswordHasher()
-        ph.verify(user["password"], password)
+        await verify_password(user["password"], password)
 
     except (
         VerificationError,
@@ -53,25 +141,66 @@ async def login(
             message="Invalid username or password"
         )
     
-    exp = (
-        datetime.datetime.now(tz=datetime.timezone.utc) + 
-        datetime.timedelta(seconds=Session.config.JWT_TOKEN_EXPIRES)
+    # hashed with older argon2 parameters: upgrade after the response
+    if needs_rehash(user["password"]):
+        background.add_task(
+            rehash_password,
+            user["id"],
+            user["password"],
+            password
+        )
+
+    return await open_session(user["id"], username, user["role"])
+
+
+# all: new token pair from the refresh token, which is used up
+@router.post("/refresh")
+async def refresh(
+    token: TokenJwt = Depends(refresh_token)
+):
+    jti, expires = uuid.uuid4().hex, session_expires()
+
+    # rotation: only the last refresh token of the session is accepted
+    rotated = await LoginSession.filter(
+        id=token.sid,
+        jti=token.jti,
+        revoked=False
+    ).update(jti=jti, expires=expires)
+
+    if not rotated:
+        # an old refresh token used again: it leaked, end the session
+        await session_cache.revoke(LoginSession.filter(id=token.sid))
+
+        raise UnicornException(
+            status=401,
+            message="Session expired"
+        )
+
+    user_id = token.id or await LoginSession.get(id=token.sid).values_list(
+        "user_id",
+        flat=True
     )
 
-    token = jwt.encode(
-        {
-            "exp": exp,
-            "username": username,
-            "role": user["role"]
-        }, 
-        Session.config.JWT_SECRET,
-        algorithm="HS256"
+    return session_tokens(
+        token.sid,
+        jti,
+        user_id,
+        token.username,
+        token.role,
+        expires
     )
 
+
+# all: logout, revoke the session of the token
+@router.delete("/")
+async def logout(
+    token: TokenJwt = Depends(token_jwt)
+):
+    await session_cache.revoke(LoginSession.filter(id=token.sid))
+
     return {
         "error": False,
-        "message": "",
-        "token": token
+        "message": ""
     }
 
 
@@ -82,7 +211,7 @@ class RegisterItem(BaseModel):
 
 
 # admin: add new user
-@router.post("/")
+@router.post("/", dependencies=[Depends(admission.passwords)])
 @roles("admin")
 async def register(
     item: RegisterItem,
@@ -113,11 +242,9 @@ async def register(
         )
 
     try:
-        ph = PasswordHasher()
-
         await Users(
             username=item.username,
-            password=ph.hash(item.password),
+            password=await hash_password(item.password),
             role=item.role.value
         ).save()
 
@@ -127,6 +254,8 @@ async def register(
             message="User alredy exists"
         )
     
+    user_count.invalidate()
+
     return {
         "error": False,
         "message": ""
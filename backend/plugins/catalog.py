@@ -0,0 +1,582 @@
+import csv
+import io
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+from pydantic import BaseModel, ValidationError, confloat, constr, validator
+from tortoise.transactions import in_transaction
+
+from .. import catalog
+from ..config import Session
+from ..database import (
+    Ingredients,
+    Menu,
+    MenuProduct,
+    Products,
+    RoleMenu,
+    RoleProduct,
+    Subcategories,
+    Variant
+)
+from ..utils import (
+    TokenJwt,
+    UnicornException,
+    admission,
+    enums,
+    remove_equal_dictionaries,
+    roles,
+    token_jwt
+)
+
+
+router = APIRouter(
+    prefix="/catalog",
+    tags=["catalog"]
+)
+
+
+CSV_COLUMNS = (
+    "type",
+    "name",
+    "parent",
+    "price",
+    "category",
+    "order",
+    "roles",
+    "optional"
+)
+
+
+class CatalogSubcategoryItem(BaseModel):
+    name: constr(strip_whitespace=True, min_length=1, max_length=20)
+    order: int
+
+
+class CatalogPriceItem(BaseModel):
+    name: constr(strip_whitespace=True, min_length=1, max_length=20)
+    price: confloat(ge=0)
+
+
+class CatalogProductItem(BaseModel):
+    name: constr(strip_whitespace=True, min_length=1, max_length=30)
+    price: confloat(gt=0)
+    category: enums.Category
+    subcategory: str
+    roles: List[str] = []
+    variant: List[CatalogPriceItem] = []
+    ingredients: List[CatalogPriceItem] = []
+
+    @validator("roles", each_item=True)
+    def check_role(cls, v):
+        if not enums.Roles.is_in_roles(v):
+            raise ValueError("wrong role")
+        return v
+
+
+class CatalogMenuProductItem(BaseModel):
+    product: str
+    optional: bool = False
+
+
+class CatalogMenuItem(BaseModel):
+    name: constr(strip_whitespace=True, min_length=1, max_length=30)
+    roles: List[str] = []
+    products: List[CatalogMenuProductItem]
+
+    @validator("roles", each_item=True)
+    def check_role(cls, v):
+        if v not in Session.config.ROLES:
+            raise ValueError("wrong role")
+        return v
+
+
+class CatalogItem(BaseModel):
+    subcategories: List[CatalogSubcategoryItem] = []
+    products: List[CatalogProductItem] = []
+    menus: List[CatalogMenuItem] = []
+
+    @validator("subcategories", "products", "menus")
+    def check_names(cls, v):
+        duplicated = [x for x, n in Counter(y.name for y in v).items() if n > 1]
+        if duplicated:
+            raise ValueError(f"duplicated names: {', '.join(duplicated)}")
+        return v
+
+
+def _split_roles(value: str) -> List[str]:
+    return [x.strip() for x in value.split("|") if x.strip()]
+
+
+def parse_csv(text: str) -> dict:
+    """
+    One row per entity, children point to their parent by name:
+
+        type,name,parent,price,category,order,roles,optional
+        subcategory,primi,,,,0,,
+        product,lasagne,primi,8,foods,,sagra|bar,
+        variant,big,lasagne,2,,,,
+        ingredient,cheese,lasagne,0.5,,,,
+        menu,menu lasagne,,,,,sagra,
+        menu_product,lasagne,menu lasagne,,,,,false
+    """
+
+    doc = {"subcategories": [], "products": [], "menus": []}
+    products, menus = {}, {}
+    children = []
+
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or "type" not in reader.fieldnames:
+        raise UnicornException(
+            status=400,
+            message="Wrong csv: missing header"
+        )
+
+    for line, row in enumerate(reader, start=2):
+        row = {k: (v or "").strip() for k, v in row.items() if k}
+        kind = row.get("type", "")
+
+        if kind == "subcategory":
+            doc["subcategories"].append({
+                "name": row.get("name", ""),
+                "order": row.get("order", "")
+            })
+        elif kind == "product":
+            p = products[row.get("name", "")] = {
+                "name": row.get("name", ""),
+                "price": row.get("price", ""),
+                "category": row.get("category", ""),
+                "subcategory": row.get("parent", ""),
+                "roles": _split_roles(row.get("roles", "")),
+                "variant": [],
+                "ingredients": []
+            }
+            doc["products"].append(p)
+        elif kind == "menu":
+            m = menus[row.get("name", "")] = {
+                "name": row.get("name", ""),
+                "roles": _split_roles(row.get("roles", "")),
+                "products": []
+            }
+            doc["menus"].append(m)
+        elif kind in ("variant", "ingredient", "menu_product"):
+            children.append((line, kind, row))
+        elif kind:
+            raise UnicornException(
+                status=400,
+                message=f"Wrong csv at line {line}: unknown type {kind}"
+            )
+
+    # children may come before their parent
+    for line, kind, row in children:
+        parents = menus if kind == "menu_product" else products
+        parent = parents.get(row.get("parent", ""))
+        if parent is None:
+            raise UnicornException(
+                status=400,
+                message=f"Wrong csv at line {line}: unknown parent"
+            )
+
+        if kind == "menu_product":
+            parent["products"].append({
+                "product": row.get("name", ""),
+                "optional": row.get("optional") or False
+            })
+        else:
+            parent["variant" if kind == "variant" else "ingredients"].append({
+                "name": row.get("name", ""),
+                "price": row.get("price", "")
+            })
+
+    return doc
+
+
+def to_csv(doc: dict) -> str:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+
+    for x in doc["subcategories"]:
+        writer.writerow({"type": "subcategory", **x})
+
+    for x in doc["products"]:
+        writer.writerow({
+            "type": "product",
+            "name": x["name"],
+            "parent": x["subcategory"],
+            "price": x["price"],
+            "category": x["category"],
+            "roles": "|".join(x["roles"])
+        })
+        for y in x["variant"]:
+            writer.writerow({"type": "variant", "parent": x["name"], **y})
+        for y in x["ingredients"]:
+            writer.writerow({"type": "ingredient", "parent": x["name"], **y})
+
+    for x in doc["menus"]:
+        writer.writerow({
+            "type": "menu",
+            "name": x["name"],
+            "roles": "|".join(x["roles"])
+        })
+        for y in x["products"]:
+            writer.writerow({
+                "type": "menu_product",
+                "name": y["product"],
+                "parent": x["name"],
+                "optional": "true" if y["optional"] else "false"
+            })
+
+    return buffer.getvalue()
+
+
+async def export_catalog() -> dict:
+    # the whole catalog by name, one query per table
+    subcategories = await Subcategories.all().order_by("order").values(
+        "id",
+        "name",
+        "order"
+    )
+    sub_names = {x["id"]: x["name"] for x in subcategories}
+
+    products = {
+        x["id"]: {
+            "name": x["name"],
+            "price": x["price"],
+            "category": x["category"].value,
+            "subcategory": sub_names[x["subcategory_id"]],
+            "roles": [],
+            "variant": [],
+            "ingredients": []
+        }
+        for x in await Products.all().order_by("id").values()
+    }
+
+    for x in await RoleProduct.all().order_by("id").values():
+        products[x["product_id"]]["roles"].append(x["role"])
+    for x in await Variant.all().order_by("id").values():
+        products[x["product_id"]]["variant"].append(
+            {"name": x["name"], "price": x["price"]}
+        )
+    for x in await Ingredients.all().order_by("id").values():
+        products[x["product_id"]]["ingredients"].append(
+            {"name": x["name"], "price": x["price"]}
+        )
+
+    menus = {
+        x["id"]: {"name": x["name"], "roles": [], "products": []}
+        for x in await Menu.all().order_by("id").values()
+    }
+
+    for x in await RoleMenu.all().order_by("id").values():
+        menus[x["menu_id"]]["roles"].append(x["role"])
+    for x in await MenuProduct.all().order_by("id").values():
+        menus[x["menu_id"]]["products"].append({
+            "product": products[x["product_id"]]["name"],
+            "optional": x["optional"]
+        })
+
+    return {
+        "subcategories": [
+            {"name": x["name"], "order": x["order"]} for x in subcategories
+        ],
+        "products": list(products.values()),
+        "menus": list(menus.values())
+    }
+
+
+async def import_catalog(item: CatalogItem) -> Dict[str, int]:
+    """
+    Upsert a whole catalog by name in one transaction:
+    - subcategories and products are created or updated
+    - variants and ingredients are created or get the new price, the ones
+      not in the document are kept since orders point to them
+    - roles of products and menus, and products of menus, are replaced
+    """
+
+    subcategories = {
+        x["name"]: x
+        for x in await Subcategories.all().values("id", "name", "order")
+    }
+    product_ids = dict(await Products.all().values_list("name", "id"))
+    menu_ids = dict(await Menu.all().values_list("name", "id"))
+    products, menus = set(product_ids), set(menu_ids)
+
+    # everything is checked before writing
+    orders = {x: y["order"] for x, y in subcategories.items()}
+    orders.update({x.name: x.order for x in item.subcategories})
+    if len(set(orders.values())) != len(orders):
+        raise UnicornException(
+            status=406,
+            message="Duplicated subcategory order"
+        )
+
+    for x in item.products:
+        if x.subcategory not in orders:
+            raise UnicornException(
+                status=406,
+                message=f"subcategory nonexistent: {x.subcategory}"
+            )
+
+    names = set(product_ids) | {x.name for x in item.products}
+    for x in item.menus:
+        wrong = [y.product for y in x.products if y.product not in names]
+        if wrong or not x.products:
+            raise UnicornException(
+                status=406,
+                message=f"Product not exist in menu {x.name}"
+            )
+
+    async with in_transaction():
+        # new orders may be taken by subcategories that are moving: park
+        # the moving ones above every order first (order is unique)
+        moving = [
+            Subcategories(id=subcategories[x.name]["id"], order=x.order)
+            for x in item.subcategories
+            if x.name in subcategories
+            and subcategories[x.name]["order"] != x.order
+        ]
+        if moving:
+            top = max(
+                [*orders.values(), *(x["order"] for x in subcategories.values())]
+            ) + 1
+            await Subcategories.bulk_update(
+                [
+                    Subcategories(id=x.id, order=top + n)
+                    for n, x in enumerate(moving)
+                ],
+                fields=["order"]
+            )
+
+        await Subcategories.bulk_create([
+            Subcategories(name=x.name, order=x.order)
+            for x in item.subcategories
+            if x.name not in subcategories
+        ])
+
+        if moving:
+            await Subcategories.bulk_update(moving, fields=["order"])
+
+        sub_ids = dict(await Subcategories.all().values_list("name", "id"))
+
+        updated = [x for x in item.products if x.name in product_ids]
+        if updated:
+            await Products.bulk_update(
+                [Products(id=product_ids[x.name], price=x.price) for x in updated],
+                fields=["price"]
+            )
+
+        # bulk_update does not quote strings on every backend: one update
+        # per (category, subcategory) instead of one per product
+        groups = defaultdict(list)
+        for x in updated:
+            groups[(x.category.value, sub_ids[x.subcategory])].append(
+                product_ids[x.name]
+            )
+        for (category, subcategory), ids in groups.items():
+            await Products.filter(id__in=ids).update(
+                category=category,
+                subcategory_id=subcategory
+            )
+
+        await Products.bulk_create([
+            Products(
+                name=x.name,
+                price=x.price,
+                category=x.category.value,
+                subcategory_id=sub_ids[x.subcategory]
+            )
+            for x in item.products
+            if x.name not in product_ids
+        ])
+
+        product_ids = dict(await Products.all().values_list("name", "id"))
+        ids = [product_ids[x.name] for x in item.products]
+
+        await RoleProduct.filter(product_id__in=ids).delete()
+        await RoleProduct.bulk_create([
+            RoleProduct(role=y, product_id=product_ids[x.name])
+            for x in item.products
+            for y in dict.fromkeys(x.roles)
+        ])
+
+        for model, key in ((Variant, "variant"), (Ingredients, "ingredients")):
+            existing = {
+                (x["product_id"], x["name"]): x["id"]
+                for x in await model.filter(product_id__in=ids).values(
+                    "id",
+                    "product_id",
+                    "name"
+                )
+            }
+            new, changed = [], []
+
+            for x in item.products:
+                pid = product_ids[x.name]
+                lines = remove_equal_dictionaries(
+                    [y.dict() for y in getattr(x, key)],
+                    "name"
+                )
+                for y in lines:
+                    if (pid, y["name"]) in existing:
+                        changed.append(model(
+                            id=existing[(pid, y["name"])],
+                            price=y["price"]
+                        ))
+                    else:
+                        new.append(model(
+                            name=y["name"],
+                            price=y["price"],
+                            product_id=pid
+                        ))
+
+            if changed:
+                await model.bulk_update(changed, fields=["price"])
+            await model.bulk_create(new)
+
+        await Menu.bulk_create([
+            Menu(name=x.name) for x in item.menus if x.name not in menu_ids
+        ])
+        menu_ids = dict(await Menu.filter(
+            name__in=[x.name for x in item.menus]
+        ).values_list("name", "id"))
+        ids = list(menu_ids.values())
+
+        await RoleMenu.filter(menu_id__in=ids).delete()
+        await RoleMenu.bulk_create([
+            RoleMenu(role=y, menu_id=menu_ids[x.name])
+            for x in item.menus
+            for y in dict.fromkeys(x.roles)
+        ])
+
+        await MenuProduct.filter(menu_id__in=ids).delete()
+        await MenuProduct.bulk_create([
+            MenuProduct(
+                menu_id=menu_ids[x.name],
+                product_id=product_ids[y["product"]],
+                optional=y["optional"]
+            )
+            for x in item.menus
+            for y in remove_equal_dictionaries([z.dict() for z in x.products])
+        ])
+
+        for entity, items, existing, ids in (
+            (catalog.SUBCATEGORY, item.subcategories, subcategories, sub_ids),
+            (catalog.PRODUCT, item.products, products, product_ids),
+            (catalog.MENU, item.menus, menus, menu_ids),
+        ):
+            await catalog.record_changes(entity, catalog.INSERT, [
+                ids[x.name] for x in items if x.name not in existing
+            ])
+            await catalog.record_changes(entity, catalog.UPDATE, [
+                ids[x.name] for x in items if x.name in existing
+            ])
+
+    catalog.invalidate()
+
+    return {
+        "subcategories": len(item.subcategories),
+        "products": len(item.products),
+        "menus": len(item.menus)
+    }
+
+
+# admin: export the whole catalog, ?format=csv for a spreadsheet
+@router.get("/")
+@roles("admin")
+async def get_catalog(
+    format: Optional[str] = "json",
+    token: TokenJwt = Depends(token_jwt)
+):
+    if format not in ("json", "csv"):
+        raise UnicornException(
+            status=400,
+            message="Wrong format"
+        )
+
+    doc = await export_catalog()
+
+    if format == "csv":
+        return Response(
+            content=to_csv(doc),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=catalog.csv"}
+        )
+
+    return {"error": False, "message": "", "catalog": doc}
+
+
+# admin: import a whole catalog, upsert by name
+@router.post("/")
+@roles("admin")
+async def add_catalog(
+    item: CatalogItem,
+    token: TokenJwt = Depends(token_jwt)
+):
+    imported = await import_catalog(item)
+
+    return {"error": False, "message": "", "imported": imported}
+
+
+# admin: import a whole catalog from a csv body (text/csv)
+@router.post("/csv")
+@roles("admin")
+async def add_catalog_csv(
+    request: Request,
+    token: TokenJwt = Depends(token_jwt)
+):
+    try:
+        text = (await request.body()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise UnicornException(
+            status=400,
+            message="Wrong csv: not utf-8"
+        )
+
+    try:
+        item = CatalogItem.parse_obj(parse_csv(text))
+    except ValidationError as e:
+        raise RequestValidationError(e.raw_errors)
+
+    imported = await import_catalog(item)
+
+    return {"error": False, "message": "", "imported": imported}
+
+
+# all: catalog changes after a version, e.g. ?since=42; a full snapshot
+# when since is 0 or older than the kept versions
+@router.get("/changes", dependencies=[Depends(admission.reads)])
+async def get_changes(
+    since: int = 0,
+    token: TokenJwt = Depends(token_jwt)
+):
+    version, changed = await catalog.changes_since(since)
+
+    return {
+        "error": False,
+        "message": "",
+        "version": version,
+        "snapshot": changed is None,
+        **await catalog.catalog_view(token.role, changed)
+    }
+
+
+# all: the catalog of the role as MessagePack for offline tills
+@router.get("/snapshot", dependencies=[Depends(admission.reads)])
+async def get_snapshot(
+    if_none_match: Optional[str] = Header(None),
+    token: TokenJwt = Depends(token_jwt)
+):
+    snapshot = await catalog.snapshot_cache.get(token.role)
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+
+    if if_none_match == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        content=snapshot.data,
+        media_type="application/msgpack",
+        headers=headers
+    )
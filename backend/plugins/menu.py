@@ -1,16 +1,18 @@
-from typing import Dict, List, Union
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from schema import Schema
+from pydantic import BaseModel, StrictBool, StrictInt, validator
 from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
 
+from .. import catalog
 from ..config import Session
 from ..database import Menu, MenuProduct, Products, RoleMenu
 from ..utils import (
     TokenJwt, 
     UnicornException, 
-    refresh_token,
+    admission, 
+    parse_fields,
     remove_equal_dictionaries, 
     roles, 
     token_jwt
@@ -22,71 +24,104 @@ router = APIRouter(
 )
 
 
-SCHEMA_MENU = Schema([{"product": int, "optional": bool}])
-SCHEMA_ROLE = Schema(Session.config.ROLES)
+MENU_COLUMNS = ("id", "name")
+MENU_FIELDS = MENU_COLUMNS + ("roles", "products")
 
 
-async def exist_products(products: List[str]) -> bool:
+class MenuProductItem(BaseModel):
+    product: StrictInt
+    optional: StrictBool
+
+    class Config:
+        extra = "forbid"
+
+
+async def exist_products(products: List[MenuProductItem]) -> bool:
     if not products:
         return False
 
-    return all([
-        await Products.filter(id=x["product"]).exists()
-        for x in products
-    ])
+    ids = {x.product for x in products}
+
+    return await Products.filter(id__in=ids).count() == len(ids)
 
 
 # all: get menu
 @router.get("/")
 async def get_menus(
-    token: TokenJwt = Depends(refresh_token)
+    fields: Optional[str] = None,
+    token: TokenJwt = Depends(token_jwt)
 ):
-    menu = await Menu.all().values()
+    menu = await Menu.all().values(*parse_fields(fields, MENU_COLUMNS))
 
     return {"error": False, "message": "", "menu": menu}
 
 
-# all: get menu from id
-@router.get("/{menu_id}")
+# all: get menu from id, e.g. ?fields=name,products
+@router.get("/{menu_id}", dependencies=[Depends(admission.reads)])
 async def get_menu(
     menu_id: int,
-    token: TokenJwt = Depends(refresh_token)
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
+    token: TokenJwt = Depends(token_jwt)
 ):
-    menu = Menu.filter(id=menu_id)
+    if expand not in (None, "products"):
+        raise UnicornException(
+            status=400,
+            message="Wrong expand"
+        )
+
+    fields = parse_fields(fields, MENU_FIELDS)
+
+    menu = await Menu.filter(id=menu_id).values(
+        *dict.fromkeys(["id"] + [x for x in MENU_COLUMNS if x in fields])
+    )
 
-    if not await menu.exists():
+    if not menu:
         raise UnicornException(
             status=406,
             message="Wrong menu_id"
         )
 
-    menu = (await menu.values())[0]
+    menu = menu[0]
+    if "id" not in fields:
+        del menu["id"]
 
     if token.role != "admin":
-        m = await RoleMenu.get_or_none(role=token.role, menu_id=menu["id"])
+        m = await RoleMenu.exists(role=token.role, menu_id=menu_id)
         if not m:
             raise UnicornException(
                 status=403,
                 message="not allowed"
             )
-    else:
-        menu["roles"] = [
-            x["role"] 
-            for x in await RoleMenu.filter(menu_id=menu["id"]).values()
-        ]
+    elif "roles" in fields:
+        menu["roles"] = await RoleMenu.filter(
+            menu_id=menu_id
+        ).values_list("role", flat=True)
     
-    menu["products"] = await MenuProduct.filter(menu_id=menu["id"]).values()
+    if "products" in fields:
+        menu["products"] = await MenuProduct.filter(menu_id=menu_id).values()
+
+        # expand=products: the details a till needs to draw the menu
+        if expand == "products":
+            details = await catalog.product_details(
+                x["product_id"] for x in menu["products"]
+            )
+            for x in menu["products"]:
+                x["product"] = details.get(x["product_id"])
 
     return {"error": False, "message": "", "menu": menu}
 
 
 class AddMenuItem(BaseModel):
     name: str
-    products: List[Dict[str, Union[int, bool]]]
+    products: List[MenuProductItem]
     roles: List[str] = []
 
-    class Config:
-        smart_union = True
+    @validator("roles", each_item=True)
+    def check_role(cls, v):
+        if v not in Session.config.ROLES:
+            raise ValueError("wrong role")
+        return v
 
 
 # admin: add menu
@@ -101,38 +136,34 @@ async def add_menu(
             status=400,
             message="Wrong name"
         )
-    if not SCHEMA_MENU.is_valid(item.products):
-        raise UnicornException(
-            status=400,
-            message="Wrong products schema"
-        )
-    if not SCHEMA_ROLE.is_valid(item.roles):
-        raise UnicornException(
-            status=400,
-            message="Wrong roles schema"
-        )
     if not await exist_products(item.products):
         raise UnicornException(
             status=400,
             message="Product not exist"
         )
 
-    products = remove_equal_dictionaries(item.products)
+    products = remove_equal_dictionaries([x.dict() for x in item.products])
     
     try:
-        menu = await Menu.create(name=item.name)
-
-        for x in list(set(item.roles)):
-            await RoleMenu(role=x, menu=menu).save()
-
-        for y in products:
-            p = await Products.get(id=y["product"])
-
-            await MenuProduct(
-                menu=menu, 
-                product=p, 
-                optional=y["optional"]
-            ).save()
+        async with in_transaction():
+            menu = await Menu.create(name=item.name)
+
+            await RoleMenu.bulk_create([
+                RoleMenu(role=x, menu=menu) 
+                for x in set(item.roles)
+            ])
+            await MenuProduct.bulk_create([
+                MenuProduct(
+                    menu=menu, 
+                    product_id=y["product"], 
+                    optional=y["optional"]
+                )
+                for y in products
+            ])
+
+            await catalog.record_changes(catalog.MENU, catalog.INSERT, [menu.id])
+
+        catalog.invalidate()
         
         return {"error": False, "message": ""}
     except IntegrityError:
@@ -181,6 +212,10 @@ async def add_product(
         optional=item.optional
     ).save()
 
+    await catalog.record_changes(catalog.MENU, catalog.UPDATE, [menu_id])
+
+    catalog.invalidate()
+
     return {"error": False, "message": ""}
 
 
@@ -218,4 +253,8 @@ async def add_role(
             message="existing role"
         )
 
+    await catalog.record_changes(catalog.MENU, catalog.UPDATE, [menu_id])
+
+    catalog.invalidate()
+
     return {"error": False, "messsage": ""}
@@ -0,0 +1,46 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import PlainTextResponse
+
+from ..config import Session
+from ..utils import UnicornException, token_jwt
+from ..utils.metrics import REGISTRY
+
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"]
+)
+
+
+async def metrics_access(
+    authorization: str = Header(alias="Authorization")
+):
+    # the scraper sends METRICS_TOKEN, a person an admin token
+    scrape = Session.config.METRICS_TOKEN
+    if scrape and secrets.compare_digest(
+        authorization.encode(), 
+        f"Bearer {scrape}".encode()
+    ):
+        return
+
+    token = await token_jwt(authorization)
+    if token.role != "admin":
+        raise UnicornException(
+            status=403,
+            message="not allowed"
+        )
+
+
+# admin: metrics in the prometheus text format
+@router.get(
+    "/", 
+    response_class=PlainTextResponse, 
+    dependencies=[Depends(metrics_access)]
+)
+async def get_metrics():
+    return PlainTextResponse(
+        REGISTRY.render(),
+        media_type="text/plain; version=0.0.4"
+    )
@@ -1,10 +1,20 @@
-from typing import Dict, Union, List, Any
-from collections import defaultdict
-
-from schema import Schema, Optional, And, Or
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-
+from typing import Dict, List, Optional, Sequence, Tuple, Type
+from collections import Counter, defaultdict
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel, StrictBool, StrictInt, conint, constr
+from tortoise.expressions import F
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+from ..catalog import (
+    PRODUCT, 
+    UPDATE, 
+    PriceEntry, 
+    menu_index, 
+    price_index, 
+    record_changes
+)
 from ..config import Session
 from ..database import (
     Orders, 
@@ -12,17 +22,15 @@ from ..database import (
     Users,
     Variant,
     Ingredients,
-    Menu,
-    MenuProduct,
     ProductOrder,
     IngredientOrder,
     MenuOrder,
-    RoleProduct,
-    RoleMenu,
     Subcategories
 )
 from ..utils import (
-    refresh_token, 
+    admission, 
+    check_batch,
+    parse_fields,
     roles, 
     token_jwt,
     UnicornException,
@@ -36,175 +44,340 @@ router = APIRouter(
 )
 
 
-SCHEMA_INFO = Schema({
-    "client": And(str, lambda n: len(n) > 2),
-    "person": Or(And(int, lambda n: n > 0), None),
-    "take_away": bool, 
-    "table": Or(And(int, lambda n: n > 0), None)
-})
-SCHEMA_PRODUCT = Schema([
-    {
-        "id": int, 
-        "variant": Or(int, None),
-        "ingredient": [int],
-        "quantity": int
-    }
-])
-SCHEMA_MENU = Schema([{"id": int, "products": SCHEMA_PRODUCT}])
+class OrderInfoItem(BaseModel):
+    client: constr(strict=True, min_length=3)
+    person: Optional[conint(strict=True, gt=0)] = None
+    take_away: StrictBool
+    table: Optional[conint(strict=True, gt=0)] = None
 
+    class Config:
+        extra = "forbid"
 
-async def check_product(products, role: str, menu: bool = False) -> bool:
-    for x in products:
-        product = await Products.filter(id=x["id"]).exists()
-        if not product:
-            return False
 
-        if (
-            not menu and 
-            not await RoleProduct.filter(role=role, product_id=x["id"]).exists()
-        ):
-            return False
+class ProductLineItem(BaseModel):
+    id: StrictInt
+    variant: Optional[StrictInt] = None
+    ingredient: List[StrictInt] = []
+    quantity: conint(strict=True, gt=0)
 
-        variant = await Variant.filter(
-            product_id=x["id"]
-        ).values()
-        if variant:
-            if x.get("variant"):
-                if not any(map(lambda y: y["id"] == x["variant"], variant)):
-                    return False
-            else:
-                return False
-        if not variant and x.get("variant"):
-            return False
+    class Config:
+        extra = "forbid"
 
-        for y in x.get("ingredient", []):
-            ingredient = await Ingredients.filter(
-                id=y, 
-                product_id=x["id"]
-            ).exists()
-            if not ingredient:
-                return False
 
-    return True
+class MenuLineItem(BaseModel):
+    id: StrictInt
+    products: List[ProductLineItem]
+
+    class Config:
+        extra = "forbid"
+
+
+def valid_line(
+    line: ProductLineItem, 
+    products: Dict[int, PriceEntry], 
+    role: str, 
+    menu: bool = False
+) -> bool:
+    # role, variant and ingredients of a line against the price index
+    p = products.get(line.id)
+    if not p or (not menu and role not in p.roles):
+        return False
+
+    if (line.variant is None) != (not p.variants):
+        return False
+    if line.variant is not None and line.variant not in p.variants:
+        return False
 
+    return all(x in p.ingredients for x in line.ingredient)
+
+
+async def check_product(
+    products: List[ProductLineItem], 
+    role: str, 
+    menu: bool = False
+) -> bool:
+    index = await price_index.products()
+
+    return all(valid_line(x, index, role, menu) for x in products)
+
+
+async def check_menu(menus: List[MenuLineItem], role: str) -> bool:
+    index = await menu_index.menus()
 
-async def check_menu(menus, role: str) -> bool:
     for x in menus:
-        if not x["products"]:
+        if not x.products:
             return False
 
-        menu = await Menu.filter(id=x["id"]).exists()
-        if not menu: 
-            return False
-        
-        if not await RoleMenu.filter(role=role, menu_id=x["id"]).exists():
+        menu = index.get(x.id)
+        if not menu or role not in menu.roles: 
             return False
 
-        list_product = [
-            z["id"] 
-            for z in await MenuProduct.filter(menu_id=x["id"]).values() 
-            if not z["optional"]
-        ]
-        ids_product = [y["id"] for y in x["products"]] 
+        ids_product = {y.id for y in x.products}
 
-        if not all(map(lambda z: z in ids_product, list_product)):
+        if not menu.required <= ids_product <= menu.allowed:
             return False
 
-        for p in x["products"]:
-            product = await MenuProduct.filter(
-                menu_id=x["id"],
-                product=p["id"]
-            ).exists()
-            if not product:
-                return False
-
-        if not await check_product(x["products"], role, menu=True):
+        if not await check_product(x.products, role, menu=True):
             return False
     
     return True
 
 
-async def add_products(products, order, menu=None):
-    for product in products:
-        variant = None
-        if product.get("variant"):
-            variant = await Variant.get(
-                id=product["variant"], 
-                product_id=product["id"]
+async def add_products(
+    lines: List[Tuple[Optional[int], ProductLineItem]], 
+    order: Orders
+):
+    """
+    Write the product and ingredient rows of an order with a query per
+    table, whatever the lines. lines: (menu order id or None, line).
+    bulk_create does not return the ids: the product rows are read back
+    in insert order, in which the database numbers them
+    """
+
+    products = await Products.in_bulk({x.id for _, x in lines})
+    variants = {}
+    if any(x.variant for _, x in lines):
+        variants = await Variant.in_bulk({x.variant for _, x in lines if x.variant})
+
+    for _, x in lines:
+        variant = variants.get(x.variant)
+        if x.id not in products or (
+            x.variant and (not variant or variant.product_id != x.id)
+        ):
+            raise UnicornException(
+                status=406,
+                message="Product not exist"
             )
-        
-        p = await ProductOrder.create(
-            menu=menu,
-            product=await Products.get(id=product["id"]),
-            variant=variant,
+
+    await ProductOrder.bulk_create([
+        ProductOrder(
+            menu_id=menu,
+            product_id=x.id,
+            variant_id=x.variant or None,
             order=order
         )
+        for menu, x in lines
+    ])
+    ids = await ProductOrder.filter(order=order).order_by("id").values_list(
+        "id", 
+        flat=True
+    )
+
+    await IngredientOrder.bulk_create([
+        IngredientOrder(ingredient_id=y, product_id=p, order=order)
+        for p, (_, x) in zip(ids, lines)
+        for y in x.ingredient
+    ])
+
+
+def stock_demand(
+    lines: List[ProductLineItem]
+) -> Tuple[Dict[int, int], Dict[int, int]]:
+    # units of each product and of each ingredient taken by the lines
+    products, ingredients = Counter(), Counter()
+
+    for x in lines:
+        products[x.id] += x.quantity
+        for y in x.ingredient:
+            ingredients[y] += x.quantity
+
+    return products, ingredients
+
+
+async def take_stock(
+    model: Type[Model], 
+    demand: Dict[int, int], 
+    product: str = "id"
+) -> List[int]:
+    """
+    Decrement the tracked stocks with conditional updates
+    (UPDATE ... SET stock = stock - n WHERE id = x AND stock >= n): no row
+    is read or locked before the write, and a sold out row updates nothing.
+    Call it inside the order transaction, which a sold out item rolls back.
+    Returns the products (the product column) of the rows now at 0
+    """
+
+    tracked = await model.filter(
+        id__in=list(demand), 
+        stock__isnull=False
+    ).values_list("id", flat=True)
+
+    # always the same order, so two orders cannot deadlock
+    for x in sorted(tracked):
+        n = demand[x]
+        if not await model.filter(id=x, stock__gte=n).update(stock=F("stock") - n):
+            name = await model.filter(id=x).values_list("name", flat=True)
+            raise UnicornException(
+                status=409,
+                message=f"{name[0]} sold out"
+            )
+
+    if not tracked:
+        return []
+
+    return await model.filter(id__in=tracked, stock=0).values_list(
+        product,
+        flat=True
+    )
+
+
+def group_products(lines: List[Tuple[str, int, Dict]]) -> Dict[str, List[Dict]]:
+    # lines: (category, subcategory order, product data)
+    result = defaultdict(list)
+
+    for category, list_order, data in lines:
+        result[category].insert(list_order, data)
+
+    return dict(result)
+
+
+ORDER_FIELDS = ("name", "price", "variant", "ingredients")
+
+
+async def load_orders(
+    ids: List[int], 
+    fields: Sequence[str] = ORDER_FIELDS
+) -> Dict[int, Dict[str, List[Dict]]]:
+    # products of each existing order, one query per table in fields
+    orders = {
+        x: [] 
+        for x in await Orders.filter(id__in=ids).values_list("id", flat=True)
+    }
+    if not orders:
+        return {}
+
+    products = await ProductOrder.filter(order_id__in=list(orders)).values()
+
+    columns = [x for x in ("name", "price") if x in fields]
+    catalog = {
+        x["id"]: x 
+        for x in await Products.filter(
+            id__in={x["product_id"] for x in products}
+        ).values("id", "category", "subcategory_id", *columns)
+    }
+    subcategories = dict(await Subcategories.filter(
+        id__in={x["subcategory_id"] for x in catalog.values()}
+    ).values_list("id", "order"))
+
+    variants = {}
+    if "variant" in fields:
+        variants = dict(await Variant.filter(
+            id__in={x["variant_id"] for x in products if x["variant_id"]}
+        ).values_list("id", "name"))
+
+    ingredients = defaultdict(list)
+    if "ingredients" in fields:
+        ingredients_order = await IngredientOrder.filter(
+            order_id__in=list(orders)
+        ).values("product_id", "ingredient_id")
+        names = dict(await Ingredients.filter(
+            id__in={x["ingredient_id"] for x in ingredients_order}
+        ).values_list("id", "name"))
+
+        for x in ingredients_order:
+            ingredients[x["product_id"]].append(names[x["ingredient_id"]])
+
+    for x in products:
+        p = catalog[x["product_id"]]
+        data = {y: p[y] for y in columns}
+
+        if x["variant_id"] in variants:
+            data["variant"] = variants[x["variant_id"]]
+
+        if ingredients[x["id"]]:
+            data["ingredients"] = ingredients[x["id"]]
+
+        orders[x["order_id"]].append(
+            (p["category"], subcategories[p["subcategory_id"]], data)
+        )
+
+    return {x: group_products(y) for x, y in orders.items()}
 
-        for ingredient in product.get("ingredient", []):
-            await IngredientOrder(
-                ingredient_id=ingredient, 
-                product=p, 
-                order=order
-            ).save()
 
+# all: get many orders, e.g. ?ids=1&ids=2
+@router.get("/batch", dependencies=[Depends(admission.reads)])
+async def get_orders(
+    ids: List[int] = Query(...),
+    fields: Optional[str] = None,
+    token: TokenJwt = Depends(token_jwt)
+):
+    ids = check_batch(ids)
+    orders = await load_orders(ids, parse_fields(fields, ORDER_FIELDS))
+
+    return {
+        "error": False, 
+        "message": "", 
+        "orders": [
+            {"id": x, "product": orders[x]} 
+            for x in ids 
+            if x in orders
+        ],
+        "not_found": [x for x in ids if x not in orders]
+    }
 
-@router.get("/{order_id}")
+
+@router.get("/{order_id}", dependencies=[Depends(admission.reads)])
 async def get_order(
     order_id: int,
-    token: TokenJwt = Depends(refresh_token)
+    fields: Optional[str] = None,
+    token: TokenJwt = Depends(token_jwt)
 ):
-    order = await Orders.get_or_none(id=order_id)
-    if not order:
+    fields = parse_fields(fields, ORDER_FIELDS)
+    order = (await load_orders([order_id], fields)).get(order_id)
+    if order is None:
         raise UnicornException(
             status=406,
             message="Order not exist"
         )
 
-    products = await ProductOrder.filter(order=order).values()
-    result = defaultdict(list)
+    return {"error": False, "message": "", "product": order}
 
-    for x in products:
-        data = {}
-        p = await Products.get(id=x["product_id"])
 
-        data["name"] = p.name
-        data["price"] = p.price
-        
-        variant = await Variant.get_or_none(id=x["variant_id"])
-        ingredients = await IngredientOrder.filter(order_id=order_id).values()
+class CreateOrdersItem(BaseModel):
+    info: OrderInfoItem
+    product: List[ProductLineItem] = []
+    menu: List[MenuLineItem] = []
 
-        if variant:
-            data["variant"] = variant.name
+    class Config:
+        extra = "forbid"
 
-        if ingredients:
-            data["ingredients"] = []
 
-        for ingredient in ingredients:
-            name = (await Ingredients.get(id=ingredient["ingredient_id"])).name
-            data["ingredients"].append(name)
-        
-        list_order = (await Subcategories.get(id=p.subcategory_id)).order
-        result[p.category].insert(list_order, data)
+def quote_line(
+    line: ProductLineItem, 
+    products: Dict[int, PriceEntry], 
+    role: str, 
+    menu: bool = False
+) -> Optional[Dict]:
+    # None if not valid
+    if not valid_line(line, products, role, menu):
+        return None
 
-    return {"error": False, "message": "", "product": dict(result)}
+    p = products[line.id]
+    data = {"id": line.id, "name": p.name, "price": p.price}
+    unit = p.price
 
+    if line.variant is not None:
+        name, price = p.variants[line.variant]
+        data["variant"] = {"id": line.variant, "name": name, "price": price}
+        unit += price
 
-class CreateOrdersItem(BaseModel):
-    # {"client": str, "person": int, "take_away": bool, "table": int}
-    info: Dict[str, Union[str, int, bool, None]]
-    # [{"id": int, "variant"?: int, "ingredient"?: [int], "quantity": int}]
-    product: List[Dict[str, Union[int, List[int], None]]] = []
-    # [{"id": int, "products": product}]
-    menu: List[Dict[str, Union[int, Any]]] = []
+    data["ingredients"] = []
+    for x in line.ingredient:
+        name, price = p.ingredients[x]
+        data["ingredients"].append({"id": x, "name": name, "price": price})
+        unit += price
 
-    class Config:
-        smart_union = True
+    data["quantity"] = line.quantity
+    data["unit"] = round(unit, 2)
+    data["total"] = round(unit * line.quantity, 2)
 
+    return data
 
-# roles: create orders
-@router.post("/")
+
+# roles: totals of an order, nothing is written
+@router.post("/quote", dependencies=[Depends(admission.reads)])
 @roles(Session.config.ROLES)
-async def create_orders(
+async def quote_orders(
     item: CreateOrdersItem,
     token: TokenJwt = Depends(token_jwt)
 ):
@@ -213,20 +386,63 @@ async def create_orders(
             status=406,
             message="No data"
         )
-    if not SCHEMA_INFO.is_valid(item.info):
+
+    products = await price_index.products()
+    menus = await menu_index.menus()
+
+    product = [quote_line(x, products, token.role) for x in item.product]
+    if None in product:
         raise UnicornException(
             status=406,
-            message="Wrong info schema"
+            message="Product not exist"
         )
-    if not SCHEMA_PRODUCT.is_valid(item.product):
-        raise UnicornException(
-            status=406,
-            message="Wrong product schema"
+
+    menu = []
+    for x in item.menu:
+        m = menus.get(x.id)
+        lines = [quote_line(y, products, token.role, True) for y in x.products]
+
+        if (
+            not x.products or 
+            not m or 
+            token.role not in m.roles or 
+            not m.required <= {y.id for y in x.products} <= m.allowed or
+            None in lines
+        ):
+            raise UnicornException(
+                status=406,
+                message="Menu not exist"
+            )
+
+        menu.append({
+            "id": x.id,
+            "products": lines,
+            "total": round(sum(y["total"] for y in lines), 2)
+        })
+
+    return {
+        "error": False,
+        "message": "",
+        "product": product,
+        "menu": menu,
+        "total": round(
+            sum(x["total"] for x in product) + sum(x["total"] for x in menu), 
+            2
         )
-    if not SCHEMA_MENU.is_valid(item.menu):
+    }
+
+
+# roles: create orders
+@router.post("/", dependencies=[Depends(admission.orders)])
+@roles(Session.config.ROLES)
+async def create_orders(
+    item: CreateOrdersItem,
+    token: TokenJwt = Depends(token_jwt)
+):
+    if not item.product and not item.menu:
         raise UnicornException(
             status=406,
-            message="Wrong menu schema"
+            message="No data"
         )
     if not await check_product(item.product, token.role):
         raise UnicornException(
@@ -240,22 +456,44 @@ async def create_orders(
         )
     
     info = item.info
+    # the id claim spares a query, the old tokens have no id
+    user_id = token.id or (await Users.get(username=token.username)).id
 
-    order = await Orders.create(
-        client=info["client"],
-        person=info.get("person", None),
-        take_away=info["take_away"],
-        table=info.get("table", None),
-        user=await Users.get(username=token.username)
+    products, ingredients = stock_demand(
+        item.product + [y for x in item.menu for y in x.products]
     )
 
-    await add_products(item.product, order)
+    async with in_transaction():
+        order = await Orders.create(
+            client=info.client,
+            person=info.person,
+            take_away=info.take_away,
+            table=info.table,
+            user_id=user_id
+        )
 
-    for menu in item.menu:
-        m = await MenuOrder.create(
-            menu_id=menu["id"],
-            order=order
+        menus = []
+        if item.menu:
+            await MenuOrder.bulk_create([
+                MenuOrder(menu_id=x.id, order=order) for x in item.menu
+            ])
+            menus = await MenuOrder.filter(order=order).order_by("id").values_list(
+                "id", 
+                flat=True
+            )
+
+        await add_products(
+            [(None, x) for x in item.product] + 
+            [(m, y) for m, x in zip(menus, item.menu) for y in x.products],
+            order
         )
-        await add_products(menu["products"], order, m)
+
+        # last, so the stock rows stay locked only until the commit
+        sold_out = await take_stock(Products, products)
+        sold_out += await take_stock(Ingredients, ingredients, "product_id")
+
+        # the catalog views show sold_out, not the count: only the rows
+        # that reached 0 are a change for the tills
+        await record_changes(PRODUCT, UPDATE, sold_out)
 
     return {"error": False, "message": "", "order_id": order.id}
@@ -1,15 +1,24 @@
 from collections import defaultdict
-from typing import Dict, List, Union
-
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from schema import Or, Schema
+from typing import List, Optional, Union
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import (
+    BaseModel, 
+    StrictFloat, 
+    StrictInt, 
+    StrictStr, 
+    confloat,
+    conint,
+    root_validator,
+    validator
+)
 from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Subquery
+from tortoise.transactions import in_transaction
 
+from .. import catalog
 from ..database import (
     Ingredients, 
-    Menu, 
-    MenuProduct, 
     Products, 
     RoleProduct,
     Subcategories, 
@@ -18,7 +27,10 @@ from ..database import (
 from ..utils import (
     TokenJwt, 
     UnicornException, 
+    admission, 
+    check_batch,
     enums,
+    parse_fields,
     remove_equal_dictionaries, 
     roles, 
     token_jwt
@@ -31,32 +43,40 @@ router = APIRouter(
 )
 
 
-SCHEMA_ROLE = Schema(enums.Roles.roles())
-SCHEMA_VARIANT_INGREDIENT = Schema([{"name": str, "price": Or(int, float)}])
-
-
-# all: get all products
-@router.get("/")
+# all: get all products, e.g. ?fields=id,name,price
+@router.get("/", dependencies=[Depends(admission.reads)])
 async def get_products(
+    fields: Optional[str] = None,
     token: TokenJwt = Depends(token_jwt)
 ):
-    products = defaultdict(list)
+    fields = parse_fields(fields, catalog.PRODUCT_COLUMNS)
 
-    categories = await Subcategories.all().order_by("order").values()
+    categories = await Subcategories.all().order_by("order").values("id", "name")
 
-    for category in categories:
-        p = await Products.filter(subcategory_id=category["id"]).values()
-        for y in p:
-            if token.role != "admin":
-                r = RoleProduct.filter(role=token.role, product_id=y["id"])
-                if not await r.exists():
-                    continue
-            products[category["name"]].append(y)
+    p = Products.all().order_by("id")
+    if token.role != "admin":
+        p = p.filter(id__in=Subquery(
+            RoleProduct.filter(role=token.role).values("product_id")
+        ))
+
+    grouped = defaultdict(list)
+    for x in await p.values(*dict.fromkeys(fields + ["subcategory_id"])):
+        grouped[x["subcategory_id"]].append(x)
+        if "subcategory_id" not in fields:
+            del x["subcategory_id"]
+        if "stock" in fields:
+            x["sold_out"] = x["stock"] == 0
+
+    products = {
+        x["name"]: grouped[x["id"]]
+        for x in categories
+        if grouped[x["id"]]
+    }
 
     return {
         "error": False,
         "message": "",
-        "products": dict(products)
+        "products": products
     }
 
 
@@ -72,53 +92,106 @@ async def get_list_product(
     }
 
 
-# all: get a product
-@router.get("/{product_id}")
+# all: products and menus whose name, or a word of it, starts with q
+@router.get("/search", dependencies=[Depends(admission.reads)])
+async def search_products(
+    q: str,
+    limit: int = Query(10, gt=0, le=50),
+    token: TokenJwt = Depends(token_jwt)
+):
+    return {
+        "error": False,
+        "message": "",
+        "results": await catalog.search_index.search(q, token.role, limit)
+    }
+
+
+# all: get many products, e.g. ?ids=1&ids=2
+@router.get("/batch", dependencies=[Depends(admission.reads)])
+async def get_products_batch(
+    ids: List[int] = Query(...),
+    fields: Optional[str] = None,
+    token: TokenJwt = Depends(token_jwt)
+):
+    ids = check_batch(ids)
+    fields = parse_fields(fields, catalog.PRODUCT_FIELDS)
+    products = await catalog.product_details(ids, roles=True, fields=fields)
+
+    not_allowed = []
+    for x, p in list(products.items()):
+        r = p.pop("roles")
+        if token.role == "admin":
+            if "roles" in fields:
+                p["roles"] = r
+        elif token.role not in r:
+            not_allowed.append(x)
+            del products[x]
+
+    return {
+        "error": False,
+        "message": "",
+        "products": [products[x] for x in ids if x in products],
+        "not_found": [
+            x for x in ids 
+            if x not in products and x not in not_allowed
+        ],
+        "not_allowed": not_allowed
+    }
+
+
+# all: get a product, e.g. ?fields=name,price,variant
+@router.get("/{product_id}", dependencies=[Depends(admission.reads)])
 async def get_product(
     product_id: int,
+    fields: Optional[str] = None,
     token: TokenJwt = Depends(token_jwt)
 ):
-    p = Products.filter(id=product_id)
+    fields = parse_fields(fields, catalog.PRODUCT_FIELDS)
+    p = await catalog.product_details([product_id], roles=True, fields=fields)
 
-    if not await p.exists():
+    if not p:
         raise UnicornException(
             status=400,
             message="product nonexistent"
         )
-    
-    p = (await p.values())[0]
+
+    p = p[product_id]
+    r = p.pop("roles")
 
     if token.role != "admin":
-        r = await RoleProduct.get_or_none(role=token.role, product_id=p["id"])
-        if not r:
+        if token.role not in r:
             raise UnicornException(
                 status=403,
                 message="not allowed"
             )
-    else:
-        p["roles"] = [
-            x[0] 
-            for x in 
-            await RoleProduct.filter(product_id=p["id"]).values_list("role")
-        ]
-    
-    p["variant"] = await Variant.filter(product_id=p["id"]).values()
-    p["ingredient"] = await Ingredients.filter(product_id=p["id"]).values()
+    elif "roles" in fields:
+        p["roles"] = r
 
     return {"error": False, "message": "", "product": p}
 
 
+class PriceItem(BaseModel):
+    name: StrictStr
+    price: Union[StrictInt, StrictFloat]
+
+    class Config:
+        extra = "forbid"
+
+
 class AddProductItem(BaseModel):
     name: str
     price: float
     category: enums.Category
     subcategory: int
     roles: List[str] = []
-    variant: List[Dict[str, Union[str, float, int]]] = []
-    ingredients: List[Dict[str, Union[str, float, int]]] = []
+    variant: List[PriceItem] = []
+    ingredients: List[PriceItem] = []
 
-    class Config:
-        smart_union = True
+    @validator("roles", each_item=True)
+    def check_role(cls, v):
+        if not enums.Roles.is_in_roles(v):
+            raise ValueError("wrong role")
+        return v
 
 
 # admin: add product
@@ -138,52 +211,51 @@ async def add_product(
             status=406,
             message="Wrong price"
         )
-    if not SCHEMA_ROLE.is_valid(item.roles):
-        raise UnicornException(
-            status=406,
-            message="Wrong roles schema"
-        )
-    if not SCHEMA_VARIANT_INGREDIENT.is_valid(item.variant):
-        raise UnicornException(
-            status=406,
-            message="Wrong variant schema"
-        )
-    if not SCHEMA_VARIANT_INGREDIENT.is_valid(item.ingredients):
+    variant = remove_equal_dictionaries(
+        [x.dict() for x in item.variant], 
+        "name"
+    )
+    ingredients = remove_equal_dictionaries(
+        [x.dict() for x in item.ingredients], 
+        "name"
+    )
+
+    s = await Subcategories.get_or_none(id=item.subcategory)
+    if not s:
         raise UnicornException(
             status=406,
-            message="Wrong ingredients schema"
+            message="subcategory nonexistent"
         )
 
-    variant = remove_equal_dictionaries(item.variant, "name")
-    ingredients = remove_equal_dictionaries(item.ingredients, "name")
-
     try:
-        s = await Subcategories.get_or_none(id=item.subcategory)
-        if not s:
-            raise UnicornException(
-                status=406,
-                message="subcategory nonexistent"
+        async with in_transaction():
+            p = await Products.create(
+                name=item.name,
+                price=item.price,
+                category=item.category.value,
+                subcategory=s
             )
 
-        p = await Products.create(
-            name=item.name,
-            price=item.price,
-            category=item.category.value,
-            subcategory=s
-        )
-
-        for x in list(set(item.roles)):
-            await RoleProduct(role=x, product=p).save()
-
-        for y in variant:
-            await Variant(name=y["name"], price=float(y["price"]), product=p).save()
-        
-        for z in ingredients:
-            await Ingredients(
-                name=z["name"], 
-                price=float(z["price"]), 
-                product=p
-            ).save()
+            await RoleProduct.bulk_create([
+                RoleProduct(role=x, product=p) 
+                for x in set(item.roles)
+            ])
+            await Variant.bulk_create([
+                Variant(name=y["name"], price=float(y["price"]), product=p)
+                for y in variant
+            ])
+            await Ingredients.bulk_create([
+                Ingredients(
+                    name=z["name"], 
+                    price=float(z["price"]), 
+                    product=p
+                )
+                for z in ingredients
+            ])
+
+            await catalog.record_changes(catalog.PRODUCT, catalog.INSERT, [p.id])
+
+        catalog.invalidate()
 
         return {"error": False, "message": ""}
 
@@ -227,15 +299,19 @@ async def add_role_product(
             message="existing role"
         )
 
+    await catalog.record_changes(catalog.PRODUCT, catalog.UPDATE, [p.id])
+
+    catalog.invalidate()
+
     return {"error": False, "messsage": ""}
 
 
 class AddVariantProductItem(BaseModel):
-    name: str
-    price: Union[int, float]
+    name: StrictStr
+    price: Union[StrictInt, StrictFloat]
 
     class Config:
-        smart_union = True
+        extra = "forbid"
 
 
 # admin: add variant to product
@@ -276,15 +352,19 @@ async def add_variant_product(
 
     await Variant(name=item.name, price=float(item.price), product=p).save()
 
+    await catalog.record_changes(catalog.PRODUCT, catalog.UPDATE, [p.id])
+
+    catalog.invalidate()
+
     return {"error": False, "messsage": ""}
 
 
 class AddIngredientProductItem(BaseModel):
-    name: str
-    price: Union[int, float]
+    name: StrictStr
+    price: Union[StrictInt, StrictFloat]
 
     class Config:
-        smart_union = True
+        extra = "forbid"
 
 
 # admin: add ingredient to product
@@ -325,9 +405,164 @@ async def add_variant_product(
 
     await Ingredients(name=item.name, price=float(item.price), product=p).save()
 
+    await catalog.record_changes(catalog.PRODUCT, catalog.UPDATE, [p.id])
+
+    catalog.invalidate()
+
     return {"error": False, "messsage": ""}
 
 
+class BulkPriceItem(BaseModel):
+    id: StrictInt
+    price: confloat(ge=0)
+
+    class Config:
+        extra = "forbid"
+
+
+class BulkRoleItem(BaseModel):
+    product: StrictInt
+    add: List[str] = []
+    remove: List[str] = []
+
+    class Config:
+        extra = "forbid"
+
+    @validator("add", "remove", each_item=True)
+    def check_role(cls, v):
+        if not enums.Roles.is_in_roles(v):
+            raise ValueError("wrong role")
+        return v
+
+
+class BulkAdjustItem(BaseModel):
+    category: Optional[enums.Category] = None
+    subcategory: Optional[StrictInt] = None
+    percent: confloat(gt=-100)
+
+    class Config:
+        extra = "forbid"
+
+    @root_validator(skip_on_failure=True)
+    def check_target(cls, values):
+        if (values["category"] is None) == (values["subcategory"] is None):
+            raise ValueError("one of category or subcategory")
+        return values
+
+
+class BulkUpdateItem(BaseModel):
+    products: List[BulkPriceItem] = []
+    variants: List[BulkPriceItem] = []
+    roles: List[BulkRoleItem] = []
+    adjust: List[BulkAdjustItem] = []
+
+    class Config:
+        extra = "forbid"
+
+
+# admin: change many prices and roles at once; percentage adjustments 
+# are applied first, then the absolute prices
+@router.put("/bulk")
+@roles("admin")
+async def bulk_update_products(
+    item: BulkUpdateItem,
+    token: TokenJwt = Depends(token_jwt)
+):
+    prices = {x.id: x.price for x in item.products}
+    variants = {x.id: x.price for x in item.variants}
+
+    if any(x.price <= 0 for x in item.products):
+        raise UnicornException(
+            status=406,
+            message="Wrong price"
+        )
+
+    ids = set(prices) | {x.product for x in item.roles}
+    if await Products.filter(id__in=ids).count() != len(ids):
+        raise UnicornException(
+            status=400,
+            message="not existing product"
+        )
+    variant_products = dict(await Variant.filter(
+        id__in=set(variants)
+    ).values_list("id", "product_id"))
+    if len(variant_products) != len(variants):
+        raise UnicornException(
+            status=400,
+            message="not existing variant"
+        )
+
+    async with in_transaction():
+        adjusted = {}
+        for x in item.adjust:
+            p = Products.filter(
+                category=x.category.value
+            ) if x.category else Products.filter(subcategory_id=x.subcategory)
+
+            for y, price in await p.values_list("id", "price"):
+                price = adjusted.get(y, price)
+                adjusted[y] = round(price * (100 + x.percent) / 100, 2)
+
+        adjusted.update(prices)
+
+        if adjusted:
+            await Products.bulk_update(
+                [Products(id=x, price=y) for x, y in adjusted.items()],
+                fields=["price"]
+            )
+        if variants:
+            await Variant.bulk_update(
+                [Variant(id=x, price=y) for x, y in variants.items()],
+                fields=["price"]
+            )
+
+        if item.roles:
+            existing = set(await RoleProduct.filter(
+                product_id__in={x.product for x in item.roles}
+            ).values_list("product_id", "role"))
+
+            removed = defaultdict(set)
+            added = set()
+            for x in item.roles:
+                for r in x.remove:
+                    removed[r].add(x.product)
+                    added.discard((x.product, r))
+                for r in x.add:
+                    added.add((x.product, r))
+                    removed[r].discard(x.product)
+
+            for r, products in removed.items():
+                if products:
+                    await RoleProduct.filter(
+                        role=r, 
+                        product_id__in=products
+                    ).delete()
+
+            await RoleProduct.bulk_create([
+                RoleProduct(role=r, product_id=x)
+                for x, r in added - existing
+            ])
+
+        await catalog.record_changes(
+            catalog.PRODUCT, 
+            catalog.UPDATE, 
+            [
+                *adjusted, 
+                *variant_products.values(), 
+                *(x.product for x in item.roles)
+            ]
+        )
+
+    catalog.invalidate()
+
+    return {
+        "error": False, 
+        "message": "",
+        "products": len(adjusted),
+        "variants": len(variants)
+    }
+
+
 class ChangePriceProductItem(BaseModel):
     price: float
 
@@ -355,6 +590,60 @@ async def change_price_product(
     
     await p.update(price=item.price)
 
+    await catalog.record_changes(catalog.PRODUCT, catalog.UPDATE, [product_id])
+
+    catalog.invalidate()
+
+    return {"error": False, "message": ""}
+
+
+class StockItem(BaseModel):
+    # null stops tracking the stock
+    stock: Optional[conint(strict=True, ge=0)]
+
+
+# admin: set the stock of a product
+@router.put("/{product_id}/stock")
+@roles("admin")
+async def change_stock_product(
+    product_id: int,
+    item: StockItem,
+    token: TokenJwt = Depends(token_jwt)
+):
+    if not await Products.filter(id=product_id).update(stock=item.stock):
+        raise UnicornException(
+            status=400,
+            message="not existing product"
+        )
+
+    await catalog.record_changes(catalog.PRODUCT, catalog.UPDATE, [product_id])
+
+    catalog.invalidate()
+
+    return {"error": False, "message": ""}
+
+
+# admin: set the stock of an ingredient of a product
+@router.put("/{product_id}/ingredient/{name}/stock")
+@roles("admin")
+async def change_stock_ingredient(
+    product_id: int,
+    name: str,
+    item: StockItem,
+    token: TokenJwt = Depends(token_jwt)
+):
+    i = Ingredients.filter(name=name, product_id=product_id)
+
+    if not await i.update(stock=item.stock):
+        raise UnicornException(
+            status=404,
+            message="ingredient not exist"
+        )
+
+    await catalog.record_changes(catalog.PRODUCT, catalog.UPDATE, [product_id])
+
+    catalog.invalidate()
+
     return {"error": False, "message": ""}
 
 
@@ -365,22 +654,23 @@ async def delete_product(
     product_id: int,
     token: TokenJwt = Depends(token_jwt)
 ):
-    product = await Products.get_or_none(id=product_id)
+    product = Products.filter(id=product_id)
 
-    if not product:
+    if not await product.exists():
         raise UnicornException(
             status=404,
             message="product not exist"
         )
     
-    menu = await MenuProduct.filter(product=product).values()
-    ids = [x["menu_id"] for x in menu]
-    ids = list(filter(lambda x: ids.count(x)==1, ids))
+    async with in_transaction():
+        deleted, changed = await catalog.delete_orphan_menus([product_id])
+        await product.delete()
 
-    for x in ids:
-        await Menu.filter(id=x).delete()
+        await catalog.record_changes(catalog.PRODUCT, catalog.DELETE, [product_id])
+        await catalog.record_changes(catalog.MENU, catalog.DELETE, deleted)
+        await catalog.record_changes(catalog.MENU, catalog.UPDATE, changed)
 
-    await product.delete()
+    catalog.invalidate()
 
     return {"error": False, "message": ""}
 
@@ -411,6 +701,10 @@ async def delete_role_product(
     
     await r.delete()
 
+    await catalog.record_changes(catalog.PRODUCT, catalog.UPDATE, [product_id])
+
+    catalog.invalidate()
+
     return {"error": False, "message": ""}
 
 
@@ -440,6 +734,10 @@ async def delete_variant_product(
     
     await v.delete()
 
+    await catalog.record_changes(catalog.PRODUCT, catalog.UPDATE, [product_id])
+
+    catalog.invalidate()
+
     return {"error": False, "message": ""}
 
 
@@ -469,4 +767,8 @@ async def delete_ingredient_product(
     
     await v.delete()
 
+    await catalog.record_changes(catalog.PRODUCT, catalog.UPDATE, [product_id])
+
+    catalog.invalidate()
+
     return {"error": False, "message": ""}
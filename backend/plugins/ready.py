@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Request
+
+from ..utils import UnicornException
+
+
+router = APIRouter(
+    prefix="/ready",
+    tags=["ready"]
+)
+
+
+# all: 200 once the startup warm-up is done, for the health checks
+@router.get("/")
+async def get_ready(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        raise UnicornException(
+            status=503,
+            message="Warming up",
+            headers={"Retry-After": "1"}
+        )
+
+    return {
+        "error": False,
+        "message": "",
+        "startup": request.app.state.startup_time
+    }
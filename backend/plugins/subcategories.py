@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Subquery
+from tortoise.transactions import in_transaction
 
-from ..database import Subcategories
+from .. import catalog
+from ..database import Products, Subcategories
 from ..utils import TokenJwt, UnicornException, roles, token_jwt
 
 
@@ -59,12 +62,16 @@ async def add_subcategory(
         )
 
     try:
-        await Subcategories(name=item.name, order=item.order).save()
+        s = await Subcategories.create(name=item.name, order=item.order)
     except IntegrityError:
         raise UnicornException(
             status=400,
             message="Existing subcategories"
         )
+
+    await catalog.record_changes(catalog.SUBCATEGORY, catalog.INSERT, [s.id])
+
+    catalog.invalidate()
     
     return {"error": False, "message": ""}
 
@@ -84,6 +91,25 @@ async def delete_subcategory(
             message="Subcategory not exist"
         )
     
-    await subcategory.delete()
+    async with in_transaction():
+        products = Products.filter(subcategory_id=subcategory_id)
+        # for the change log only, the cascade below stays set-based
+        ids = await products.values_list("id", flat=True)
+
+        deleted, changed = await catalog.delete_orphan_menus(
+            Subquery(products.values("id"))
+        )
+        await subcategory.delete()
+
+        await catalog.record_changes(
+            catalog.SUBCATEGORY, 
+            catalog.DELETE, 
+            [subcategory_id]
+        )
+        await catalog.record_changes(catalog.PRODUCT, catalog.DELETE, ids)
+        await catalog.record_changes(catalog.MENU, catalog.DELETE, deleted)
+        await catalog.record_changes(catalog.MENU, catalog.UPDATE, changed)
+
+    catalog.invalidate()
 
     return {"error": False, "message": ""}
@@ -1,11 +1,22 @@
 import math
+from typing import Optional
 
-from argon2 import PasswordHasher
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel
 
-from ..database import Users
-from ..utils import TokenJwt, UnicornException, roles, token_jwt
+from ..config import Session
+from ..database import LoginSession, Users
+from ..utils import (
+    TokenJwt, 
+    UnicornException, 
+    admission, 
+    hash_password, 
+    parse_fields,
+    roles, 
+    session_cache,
+    token_jwt,
+    user_count
+)
 
 
 router = APIRouter(
@@ -14,25 +25,45 @@ router = APIRouter(
 )
 
 
-# admin: get list of user
+USER_FIELDS = ("id", "username", "role")
+
+
+# admin: get list of user, by id: ?after= the "next" of the previous
+# page, or the old ?page=
 @router.get("/")
 @roles("admin")
 async def get_users(
-    page: int,
+    page: Optional[int] = Query(None, gt=0),
+    after: Optional[int] = None,
+    size: Optional[int] = Query(None, gt=0, le=100),
+    fields: Optional[str] = None,
     token: TokenJwt = Depends(token_jwt)
 ):
+    size = size or Session.config.USERS_PAGE_SIZE
+    columns = parse_fields(fields, USER_FIELDS)
+
     users = Users.all().exclude(username=token.username)
-    lst = await users.offset((page-1)*10).limit(10).values(
-        "id", 
-        "username", 
-        "role"
-    )
+    if page is not None:
+        query = users.order_by("id").offset((page-1)*size)
+    else:
+        # keyset: no rows skipped however deep the page
+        query = users.filter(id__gt=after or 0).order_by("id")
+
+    lst = await query.limit(size).values(*dict.fromkeys([*columns, "id"]))
+    cursor = lst[-1]["id"] if len(lst) == size else None
+    if "id" not in columns:
+        for x in lst:
+            del x["id"]
+
+    total = await user_count.count(users)
 
     return {
         "error": False,
         "message": "",
         "users": lst,
-        "page": math.ceil(await users.count() / 10)
+        "page": math.ceil(total / size),
+        "total": total,
+        "next": cursor
     }
 
 
@@ -40,9 +71,12 @@ async def get_users(
 @router.get("/{username}")
 async def get_user_admin(
     username: str,
+    fields: Optional[str] = None,
     token: TokenJwt = Depends(token_jwt)
 ):
-    user = await Users.get_or_none(username=username)
+    user = await Users.filter(username=username).values(
+        *parse_fields(fields, USER_FIELDS)
+    )
 
     if not user:
         raise UnicornException(
@@ -64,7 +98,7 @@ async def get_user_admin(
     return {
         "error": False,
         "message": "",
-        "user": await user.to_dict()
+        "user": user[0]
     }
 
 
@@ -73,15 +107,20 @@ class ChangePasswordItem(BaseModel):
 
 
 # all: change password of user
-@router.put("/")
+@router.put("/", dependencies=[Depends(admission.passwords)])
 async def change_password(
     item: ChangePasswordItem,
     token: TokenJwt = Depends(token_jwt)
 ):
-    ph = PasswordHasher()
-
     await Users.filter(username=token.username).update(
-        password=ph.hash(item.password)
+        password=await hash_password(item.password)
+    )
+
+    # the other devices have to login with the new password
+    await session_cache.revoke(
+        LoginSession.filter(user__username=token.username).exclude(
+            id=token.sid
+        )
     )
 
     return {
@@ -111,7 +150,9 @@ async def delete_user(
             message="You cannot delete an admin"
         )
 
+    await session_cache.revoke(LoginSession.filter(user_id=user_id))
     await user.delete()
+    user_count.invalidate()
 
     return {
         "error": False,
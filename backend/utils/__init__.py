@@ -1,6 +1,9 @@
+from .counts import CountCache, user_count
 from .decorators import roles
 from .dependencies import refresh_token, token_jwt
 from .enums import Category
 from .exception import UnicornException
+from .password import hash_password, needs_rehash, verify_password
+from .sessions import SessionCache, session_cache
 from .token import TokenJwt
-from .utils import remove_equal_dictionaries
+from .utils import check_batch, parse_fields, remove_equal_dictionaries
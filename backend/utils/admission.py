@@ -0,0 +1,84 @@
+import asyncio
+import math
+
+from .exception import UnicornException
+from .metrics import REGISTRY
+from ..config import Session
+
+
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    "festival_admission_active",
+    "Requests holding a slot of the limiter",
+    ("limiter",)
+)
+ADMISSION_QUEUE = REGISTRY.gauge(
+    "festival_admission_queue_depth",
+    "Requests waiting for a slot of the limiter",
+    ("limiter",)
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "festival_admission_rejected_total",
+    "Requests rejected with 503 because the queue was full",
+    ("limiter",)
+)
+
+
+class Limiter:
+    """
+    Concurrency limit for a class of routes, used as a dependency:
+    at most <PREFIX>_CONCURRENCY requests run, <PREFIX>_QUEUE wait and
+    the others get a 503 with Retry-After
+    """
+
+    def __init__(self, name: str, prefix: str):
+        self.name = name
+        self.prefix = prefix
+        self.waiting = 0
+        self._semaphore = None
+
+    @property
+    def concurrency(self) -> int:
+        return getattr(Session.config, f"{self.prefix}_CONCURRENCY")
+
+    @property
+    def queue(self) -> int:
+        return getattr(Session.config, f"{self.prefix}_QUEUE")
+
+    async def __call__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        if self._semaphore.locked() and self.waiting >= self.queue:
+            ADMISSION_REJECTED.inc(limiter=self.name)
+            raise UnicornException(
+                status=503,
+                message="Server busy, retry later",
+                headers={
+                    "Retry-After": str(
+                        math.ceil(Session.config.ADMISSION_RETRY_AFTER)
+                    )
+                }
+            )
+
+        self.waiting += 1
+        ADMISSION_QUEUE.set(self.waiting, limiter=self.name)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            ADMISSION_QUEUE.set(self.waiting, limiter=self.name)
+
+        ADMISSION_ACTIVE.inc(limiter=self.name)
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+            ADMISSION_ACTIVE.dec(limiter=self.name)
+
+
+# order writes
+orders = Limiter("orders", "ORDERS")
+# argon2 hashing and verification
+passwords = Limiter("passwords", "PASSWORDS")
+# reads that run many queries
+reads = Limiter("reads", "READS")
@@ -0,0 +1,97 @@
+"""
+Pick the argon2 parameters for this host.
+
+Measures the hashing time and chooses the largest memory cost, then the
+largest time cost, whose hash stays within the target latency. Prints
+the lines to put in the .env:
+
+    python -m backend.utils.calibrate
+    python -m backend.utils.calibrate --target-ms 150 --max-memory 32768
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from argon2 import PasswordHasher
+
+
+MIN_MEMORY = 8192
+MAX_TIME_COST = 10
+
+
+def measure(
+    time_cost: int,
+    memory_cost: int,
+    parallelism: int,
+    repeat: int
+) -> float:
+    # median seconds of a hash
+    hasher = PasswordHasher(
+        time_cost=time_cost,
+        memory_cost=memory_cost,
+        parallelism=parallelism
+    )
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hasher.hash("calibration password")
+        samples.append(time.perf_counter() - start)
+
+    return statistics.median(samples)
+
+
+def calibrate(
+    target: float,
+    max_memory: int,
+    parallelism: int,
+    repeat: int
+) -> dict:
+    # memory first: it is what makes the attacks expensive
+    memory_cost = max_memory
+    elapsed = measure(1, memory_cost, parallelism, repeat)
+    while elapsed > target and memory_cost // 2 >= MIN_MEMORY:
+        memory_cost //= 2
+        elapsed = measure(1, memory_cost, parallelism, repeat)
+
+    time_cost = 1
+    while time_cost < MAX_TIME_COST:
+        candidate = measure(time_cost + 1, memory_cost, parallelism, repeat)
+        if candidate > target:
+            break
+        time_cost, elapsed = time_cost + 1, candidate
+
+    return {
+        "time_cost": time_cost,
+        "memory_cost": memory_cost,
+        "parallelism": parallelism,
+        "elapsed": elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target-ms", type=float, default=250, help="latency of a hash")
+    parser.add_argument("--max-memory", type=int, default=65536, help="KiB per hash")
+    parser.add_argument("--parallelism", type=int, default=min(os.cpu_count() or 1, 4))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    result = calibrate(
+        args.target_ms / 1000,
+        args.max_memory,
+        args.parallelism,
+        args.repeat
+    )
+
+    # the peak memory is PASSWORDS_CONCURRENCY hashes at once
+    print(f"{result['elapsed'] * 1000:.0f} ms and {result['memory_cost'] // 1024} MiB per hash")
+    print(f"ARGON2_TIME_COST={result['time_cost']}")
+    print(f"ARGON2_MEMORY_COST={result['memory_cost']}")
+    print(f"ARGON2_PARALLELISM={result['parallelism']}")
+
+
+if __name__ == "__main__":
+    main()
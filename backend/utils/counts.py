@@ -0,0 +1,38 @@
+import time
+from typing import Optional
+
+from tortoise.queryset import QuerySet
+
+from ..config import Session
+from .metrics import record_cache
+
+
+class CountCache:
+    """
+    A row count kept for COUNT_CACHE_TTL seconds; invalidate() where
+    rows are added or deleted makes this process see them at once
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._count: Optional[int] = None
+        self._time = 0.0
+
+    def invalidate(self):
+        self._count = None
+
+    async def count(self, query: QuerySet) -> int:
+        now = time.monotonic()
+        hit = (
+            self._count is not None and
+            now - self._time < Session.config.COUNT_CACHE_TTL
+        )
+        record_cache(self.name, hit)
+
+        if not hit:
+            self._count, self._time = await query.count(), now
+
+        return self._count
+
+
+user_count = CountCache("user_count")
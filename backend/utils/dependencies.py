@@ -13,6 +13,7 @@ from jwt.exceptions import (
 
 from ..config import Session
 from .exception import UnicornException
+from .sessions import session_cache
 from .token import TokenJwt
 
 
@@ -27,8 +28,6 @@ async def token_jwt(
             algorithms=["HS256"]
         ))
 
-        return d
-
     except (
         InvalidTokenError,
         DecodeError,
@@ -45,6 +44,20 @@ async def token_jwt(
             message="JWT Error!"
         )
 
+    if d.type != "access":
+        raise UnicornException(
+            status=400,
+            message="Not access token!"
+        )
+
+    if not await session_cache.valid(d.sid):
+        raise UnicornException(
+            status=401,
+            message="Session expired"
+        )
+
+    return d
+
 
 async def refresh_token(
     refresh_token: str = Header(alias="Authorization")
@@ -57,14 +70,6 @@ async def refresh_token(
             algorithms=["HS256"]
         ))
 
-        if d.type != "refresh":
-            raise UnicornException(
-                status=400,
-                message="Not refresh token!"
-            )
-
-        return d
-
     except (
         InvalidTokenError,
         DecodeError,
@@ -80,3 +85,11 @@ async def refresh_token(
             status=401, 
             message="Refresh JWT Error!"
         )
+
+    if d.type != "refresh":
+        raise UnicornException(
+            status=400,
+            message="Not refresh token!"
+        )
+
+    return d
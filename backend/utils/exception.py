@@ -1,6 +1,7 @@
 
 
 class UnicornException(Exception):
-    def __init__(self, status: int, message: str):
+    def __init__(self, status: int, message: str, headers: dict = None):
         self.status = status
         self.message = message
+        self.headers = headers
@@ -0,0 +1,280 @@
+import asyncio
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra=""):
+    labels = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        labels.append(extra)
+
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(x, "")) for x in self.labels)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield (
+                f"{self.name}{_format_labels(self.labels, key)} "
+                f"{_format_value(value)}"
+            )
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets=LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        data = self._values.get(key)
+        if data is None:
+            # [bucket counts..., +Inf count, sum]
+            data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, data in sorted(self._values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data):
+                total += count
+                le = f'le="{_format_value(bound)}"'
+                yield (
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le)} "
+                    f"{total}"
+                )
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_format_value(data[-1])}"
+            yield f"{self.name}_count{labels} {total}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        return "\n".join(x.render() for x in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "festival_http_requests_total",
+    "Number of HTTP requests by route and status code",
+    ("method", "route", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "festival_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route")
+)
+HTTP_IN_PROGRESS = REGISTRY.gauge(
+    "festival_http_requests_in_progress",
+    "Number of HTTP requests being served"
+)
+DB_QUERIES = REGISTRY.histogram(
+    "festival_db_queries_per_request",
+    "Number of ORM queries issued by a request",
+    ("method", "route"),
+    buckets=QUERY_BUCKETS
+)
+DB_REQUEST_TIME = REGISTRY.histogram(
+    "festival_db_time_per_request_seconds",
+    "Time spent in the database by a request",
+    ("method", "route")
+)
+DB_QUERY_TIME = REGISTRY.histogram(
+    "festival_db_query_duration_seconds",
+    "Duration of a single ORM query",
+    ("statement",)
+)
+ARGON2_TIME = REGISTRY.histogram(
+    "festival_argon2_duration_seconds",
+    "Time spent hashing or verifying passwords",
+    ("operation",)
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "festival_cache_requests_total",
+    "In-memory cache lookups by cache and result (hit or miss)",
+    ("cache", "result")
+)
+STARTUP_TIME = REGISTRY.gauge(
+    "festival_startup_seconds",
+    "Time from the app import to ready, warm-up included"
+)
+EVENT_LOOP_LAG = REGISTRY.gauge(
+    "festival_event_loop_lag_seconds",
+    "Last measured delay of the event loop"
+)
+EVENT_LOOP_LAG_HISTOGRAM = REGISTRY.histogram(
+    "festival_event_loop_lag_distribution_seconds",
+    "Distribution of the event loop delay"
+)
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_time: float = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats",
+    default=None
+)
+
+
+def record_query(query: str, elapsed: float):
+    statement = query.lstrip().split(" ", 1)[0].upper()
+    DB_QUERY_TIME.observe(elapsed, statement=statement)
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_PROGRESS.dec()
+            _request_stats.reset(token)
+
+            route = scope.get("route")
+            # unmatched paths share one label to keep cardinality bounded
+            path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+
+            HTTP_REQUESTS.inc(method=method, route=path, status=status)
+            HTTP_LATENCY.observe(elapsed, method=method, route=path)
+            DB_QUERIES.observe(stats.queries, method=method, route=path)
+            DB_REQUEST_TIME.observe(stats.db_time, method=method, route=path)
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
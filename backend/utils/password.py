@@ -0,0 +1,48 @@
+from typing import Optional
+
+from argon2 import PasswordHasher
+from starlette.concurrency import run_in_threadpool
+
+from ..config import Session
+from .metrics import ARGON2_TIME
+
+
+_hasher: Optional[PasswordHasher] = None
+
+
+def hasher() -> PasswordHasher:
+    # built on first use: the parameters come from the config
+    global _hasher
+
+    if _hasher is None:
+        _hasher = PasswordHasher(
+            time_cost=Session.config.ARGON2_TIME_COST,
+            memory_cost=Session.config.ARGON2_MEMORY_COST,
+            parallelism=Session.config.ARGON2_PARALLELISM
+        )
+
+    return _hasher
+
+
+def _hash(password: str) -> str:
+    with ARGON2_TIME.time(operation="hash"):
+        return hasher().hash(password)
+
+
+def _verify(hash: str, password: str) -> bool:
+    with ARGON2_TIME.time(operation="verify"):
+        return hasher().verify(hash, password)
+
+
+# argon2 is cpu bound: keep it off the event loop
+async def hash_password(password: str) -> str:
+    return await run_in_threadpool(_hash, password)
+
+
+async def verify_password(hash: str, password: str) -> bool:
+    return await run_in_threadpool(_verify, hash, password)
+
+
+def needs_rehash(hash: str) -> bool:
+    # parses the parameters of the hash only, no hashing
+    return hasher().check_needs_rehash(hash)
@@ -0,0 +1,73 @@
+import datetime
+import time
+from typing import Dict, Iterable, Tuple
+
+from tortoise.queryset import QuerySet
+
+from ..config import Session
+from .metrics import record_cache
+
+
+class SessionCache:
+    """
+    Whether a login session is still valid, checked on the database at
+    most once every SESSION_CACHE_TTL seconds; a revocation made by this
+    process is seen at once
+    """
+
+    def __init__(self):
+        # session id -> (valid, checked at)
+        self._sessions: Dict[int, Tuple[bool, float]] = {}
+
+    def clear(self):
+        self._sessions.clear()
+
+    def add(self, sid: int):
+        # a session this process just opened is valid
+        self._sessions[sid] = (True, time.monotonic())
+
+    def forget(self, sids: Iterable[int]):
+        now = time.monotonic()
+        for x in sids:
+            self._sessions[x] = (False, now)
+
+    async def valid(self, sid: int) -> bool:
+        # lazy: the models import the utils package
+        from ..database import LoginSession
+
+        now = time.monotonic()
+        cached = self._sessions.get(sid)
+        hit = (
+            cached is not None and
+            now - cached[1] < Session.config.SESSION_CACHE_TTL
+        )
+        record_cache("login_session", hit)
+        if hit:
+            return cached[0]
+
+        valid = await LoginSession.exists(
+            id=sid,
+            revoked=False,
+            expires__gt=datetime.datetime.now(tz=datetime.timezone.utc)
+        )
+
+        # drop what expired, the map holds the recently seen sessions only
+        if len(self._sessions) > 1024:
+            self._sessions = {
+                x: y for x, y in self._sessions.items()
+                if now - y[1] < Session.config.SESSION_CACHE_TTL
+            }
+        self._sessions[sid] = (valid, now)
+
+        return valid
+
+    async def revoke(self, sessions: QuerySet):
+        ids = await sessions.filter(revoked=False).values_list("id", flat=True)
+        if not ids:
+            return
+
+        await sessions.model.filter(id__in=ids).update(revoked=True)
+        self.forget(ids)
+
+
+session_cache = SessionCache()
@@ -6,6 +6,13 @@ class TokenJwt:
     username: str
     role: str
     exp: int
+    # "access" or "refresh"
+    type: str = "access"
+    jti: str = ""
+    # the login session of the token
+    sid: int = 0
+    # the user, 0 in the tokens issued before the claim
+    id: int = 0
 
     def __str__(self) -> str:
         return f"TokenJwt(username={self.username}, role={self.role}, exp={self.exp}, type={self.type})"
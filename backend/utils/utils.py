@@ -1,4 +1,7 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence
+
+from ..config import Session
+from .exception import UnicornException
 
 
 def remove_equal_dictionaries(p: List[Dict], key: str = "product"):
@@ -9,3 +12,33 @@ def remove_equal_dictionaries(p: List[Dict], key: str = "product"):
             tmp[r[key]] = r
 
     return list(tmp.values())
+
+
+def check_batch(ids: List[int]) -> List[int]:
+    # ids of a batch request without duplicates, in the requested order
+    ids = list(dict.fromkeys(ids))
+
+    if len(ids) > Session.config.BATCH_MAX_SIZE:
+        raise UnicornException(
+            status=400,
+            message=f"Too many ids (max {Session.config.BATCH_MAX_SIZE})"
+        )
+
+    return ids
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    # fields=a,b of a read route: the requested subset, everything if missing
+    if fields is None:
+        return list(allowed)
+
+    lst = list(dict.fromkeys(x.strip() for x in fields.split(",") if x.strip()))
+    wrong = [x for x in lst if x not in allowed]
+
+    if not lst or wrong:
+        raise UnicornException(
+            status=400,
+            message=f"Wrong fields, allowed: {', '.join(allowed)}"
+        )
+
+    return lst
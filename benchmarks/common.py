@@ -0,0 +1,267 @@
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# the application reads its settings at import time
+for key, value in {
+    "DB_URL": "sqlite://:memory:",
+    "JWT_SECRET": "benchmark-secret-benchmark-secret",
+    "JWT_TOKEN_EXPIRES": "3600",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+from tortoise import Tortoise
+
+from backend import catalog
+from backend.config import Config, Session
+
+if not hasattr(Session, "config"):
+    Session.config = Config()
+
+from backend.database import (
+    Ingredients,
+    Menu,
+    MenuProduct,
+    Products,
+    RoleMenu,
+    RoleProduct,
+    Subcategories,
+    Users,
+    Variant,
+    tortoise_config,
+)
+from backend.database.instrument import instrument_clients
+from backend.utils import hash_password, session_cache, user_count
+
+
+PASSWORD = "benchmark"
+
+
+async def init_db(db_url: str = "sqlite://:memory:"):
+    """
+    Open a scratch database created for the run and dropped by close_db:
+    SQLite in memory by default, or a file / Postgres database
+    """
+
+    await Tortoise.init(config=tortoise_config(db_url), _create_db=True)
+    await Tortoise.generate_schemas()
+    instrument_clients()
+    reset_caches()
+
+
+async def close_db():
+    await Tortoise._drop_databases()
+    reset_caches()
+
+
+def reset_caches():
+    # the in-memory views are per process: a new database must not find
+    # the ids of the previous one in them
+    catalog.invalidate()
+    session_cache.clear()
+    user_count.invalidate()
+
+
+@dataclass
+class Catalog:
+    # product id -> {"variants": [ids], "ingredients": [ids], "roles": [..]}
+    products: Dict[int, dict] = field(default_factory=dict)
+    # menu id -> {"required": [ids], "optional": [ids], "roles": [..]}
+    menus: Dict[int, dict] = field(default_factory=dict)
+    users: List[str] = field(default_factory=list)
+
+
+async def seed(
+    rng: random.Random,
+    subcategories: int = 8,
+    products: int = 60,
+    menus: int = 10,
+    tills: int = 4,
+    roles: List[str] = None,
+) -> Catalog:
+    """
+    Seed a festival-like catalog: products with variants, ingredients and
+    role grants, menus made of required and optional products, one user
+    per till and an admin
+    """
+
+    roles = roles or ["sagra"]
+    catalog = Catalog()
+
+    await Subcategories.bulk_create([
+        Subcategories(name=f"subcategory {x}", order=x)
+        for x in range(subcategories)
+    ])
+    subs = await Subcategories.all().values_list("id", flat=True)
+
+    await Products.bulk_create([
+        Products(
+            name=f"product {x}",
+            price=round(rng.uniform(1, 15), 1),
+            category="foods" if x % 3 else "drinks",
+            subcategory_id=subs[x % len(subs)],
+        )
+        for x in range(products)
+    ])
+    ids = await Products.all().order_by("id").values_list("id", flat=True)
+
+    variants, ingredients, grants = [], [], []
+    for x in ids:
+        variants.extend(
+            Variant(name=f"variant {y}", price=rng.choice([0, 0.5, 1]), product_id=x)
+            for y in range(rng.choice([0, 0, 2, 3]))
+        )
+        ingredients.extend(
+            Ingredients(name=f"ingredient {y}", price=0.5, product_id=x)
+            for y in range(rng.randint(0, 4))
+        )
+        grants.extend(RoleProduct(role=r, product_id=x) for r in roles)
+
+    await Variant.bulk_create(variants)
+    await Ingredients.bulk_create(ingredients)
+    await RoleProduct.bulk_create(grants)
+
+    for x in ids:
+        catalog.products[x] = {"variants": [], "ingredients": [], "roles": roles}
+    for v in await Variant.all().values("id", "product_id"):
+        catalog.products[v["product_id"]]["variants"].append(v["id"])
+    for i in await Ingredients.all().values("id", "product_id"):
+        catalog.products[i["product_id"]]["ingredients"].append(i["id"])
+
+    await Menu.bulk_create([Menu(name=f"menu {x}") for x in range(menus)])
+    menu_ids = await Menu.all().order_by("id").values_list("id", flat=True)
+
+    rows = []
+    for m in menu_ids:
+        chosen = rng.sample(list(ids), k=min(len(ids), rng.randint(2, 5)))
+        required, optional = chosen[:2], chosen[2:]
+        rows.extend(MenuProduct(menu_id=m, product_id=p) for p in required)
+        rows.extend(
+            MenuProduct(menu_id=m, product_id=p, optional=True)
+            for p in optional
+        )
+        catalog.menus[m] = {
+            "required": required,
+            "optional": optional,
+            "roles": roles
+        }
+
+    await MenuProduct.bulk_create(rows)
+    await RoleMenu.bulk_create([
+        RoleMenu(role=r, menu_id=m) for m in menu_ids for r in roles
+    ])
+
+    password = await hash_password(PASSWORD)
+    await Users.bulk_create(
+        [Users(username="admin", password=password, role="admin")] +
+        [
+            Users(username=f"till{x}", password=password, role=roles[x % len(roles)])
+            for x in range(tills)
+        ]
+    )
+    catalog.users = [f"till{x}" for x in range(tills)]
+
+    return catalog
+
+
+def product_line(rng: random.Random, catalog: Catalog, product_id: int) -> dict:
+    p = catalog.products[product_id]
+
+    return {
+        "id": product_id,
+        "variant": rng.choice(p["variants"]) if p["variants"] else None,
+        "ingredient": rng.sample(
+            p["ingredients"],
+            k=rng.randint(0, len(p["ingredients"]))
+        ),
+        "quantity": rng.randint(1, 3)
+    }
+
+
+def random_order(
+    rng: random.Random,
+    catalog: Catalog,
+    products: int = 3,
+    menus: int = 1
+) -> dict:
+    """
+    A valid order payload for POST /orders/ with the given number of
+    product and menu lines
+    """
+
+    product_ids = list(catalog.products)
+    menu_ids = list(catalog.menus)
+
+    order = {
+        "info": {
+            "client": f"client {rng.randint(100, 999)}",
+            "person": rng.randint(1, 8),
+            "take_away": rng.random() < 0.2,
+            "table": rng.randint(1, 60)
+        },
+        "product": [
+            product_line(rng, catalog, rng.choice(product_ids))
+            for _ in range(products)
+        ],
+        "menu": []
+    }
+
+    for _ in range(menus if menu_ids else 0):
+        menu_id = rng.choice(menu_ids)
+        m = catalog.menus[menu_id]
+        chosen = m["required"] + [x for x in m["optional"] if rng.random() < 0.5]
+        order["menu"].append({
+            "id": menu_id,
+            "products": [product_line(rng, catalog, x) for x in chosen]
+        })
+
+    return order
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+class Timer:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, name: str, elapsed: float, ok: bool = True):
+        self.samples.setdefault(name, []).append(elapsed)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self, wall: float) -> str:
+        lines = [
+            f"{'operation':<14}{'count':>8}{'errors':>8}{'req/s':>10}"
+            f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        ]
+        for name, values in self.samples.items():
+            lines.append(
+                f"{name:<14}{len(values):>8}{self.errors.get(name, 0):>8}"
+                f"{len(values) / wall:>10.1f}"
+                f"{percentile(values, 50) * 1000:>10.2f}"
+                f"{percentile(values, 90) * 1000:>10.2f}"
+                f"{percentile(values, 99) * 1000:>10.2f}"
+                f"{max(values) * 1000:>10.2f}"
+            )
+        return "\n".join(lines)
+
+
+def now() -> float:
+    return time.perf_counter()
@@ -0,0 +1,191 @@
+"""
+Festival-rush load benchmark.
+
+Seeds a catalog, logs N tills in at once and lets them place mixed
+product and menu orders through POST /orders/ while kitchen screens
+read GET /orders/{id}. Requests go through the ASGI app in-process, so
+no server or network is needed:
+
+    python -m benchmarks.load --tills 8 --orders 50
+    python -m benchmarks.load --db-url sqlite:///tmp/festival_bench.sqlite3
+    python -m benchmarks.load --db-url postgres://user:pw@localhost:5432/festival_bench
+
+The database in the URL is created for the run and dropped at the end,
+so never point it at a real database.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+import httpx
+
+from .common import (
+    PASSWORD,
+    Timer,
+    close_db,
+    init_db,
+    now,
+    percentile,
+    random_order,
+    seed,
+)
+
+
+async def login(client: httpx.AsyncClient, timer: Timer, username: str) -> dict:
+    while True:
+        start = now()
+        r = await client.get("/auth/", params={
+            "username": username,
+            "password": PASSWORD
+        })
+        timer.add("login", now() - start, r.status_code == 200)
+
+        if r.status_code != 503:
+            return {"Authorization": f"Bearer {r.json()['token']}"}
+
+        # shed by admission control: come back later like a till would
+        await asyncio.sleep(float(r.headers.get("Retry-After", 1)))
+
+
+async def till(
+    client: httpx.AsyncClient,
+    timer: Timer,
+    rng: random.Random,
+    catalog,
+    username: str,
+    orders: int,
+    placed: list,
+):
+    headers = await login(client, timer, username)
+
+    for _ in range(orders):
+        payload = random_order(
+            rng,
+            catalog,
+            products=rng.randint(0, 4),
+            menus=rng.randint(0, 2)
+        )
+        if not payload["product"] and not payload["menu"]:
+            payload["menu"] = random_order(rng, catalog, 0, 1)["menu"]
+
+        start = now()
+        r = await client.post("/orders/", json=payload, headers=headers)
+        ok = r.status_code == 200
+        timer.add("create_order", now() - start, ok)
+
+        if ok:
+            placed.append(r.json()["order_id"])
+
+
+async def kitchen(
+    client: httpx.AsyncClient,
+    timer: Timer,
+    rng: random.Random,
+    placed: list,
+    done: asyncio.Event,
+    interval: float,
+):
+    headers = await login(client, timer, "admin")
+
+    while not done.is_set():
+        if placed:
+            # screens mostly look at the latest orders
+            order_id = placed[-1 - min(len(placed) - 1, int(rng.expovariate(0.3)))]
+
+            start = now()
+            r = await client.get(f"/orders/{order_id}", headers=headers)
+            timer.add("get_order", now() - start, r.status_code == 200)
+
+        await asyncio.sleep(interval)
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+
+    await init_db(args.db_url)
+    try:
+        catalog = await seed(
+            rng,
+            subcategories=args.subcategories,
+            products=args.products,
+            menus=args.menus,
+            tills=args.tills,
+        )
+
+        from main import app
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench"
+        ) as client:
+            timer = Timer()
+            placed = []
+            done = asyncio.Event()
+
+            start = now()
+            screens = [
+                asyncio.create_task(kitchen(
+                    client, timer, random.Random(rng.random()),
+                    placed, done, args.kitchen_interval
+                ))
+                for _ in range(args.kitchens)
+            ]
+            await asyncio.gather(*[
+                till(
+                    client, timer, random.Random(rng.random()),
+                    catalog, x, args.orders, placed
+                )
+                for x in catalog.users
+            ])
+            done.set()
+            await asyncio.gather(*screens)
+            wall = now() - start
+
+        return {"wall": wall, "timer": timer}
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--tills", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=25, help="orders per till")
+    parser.add_argument("--kitchens", type=int, default=2)
+    parser.add_argument("--kitchen-interval", type=float, default=0.01)
+    parser.add_argument("--subcategories", type=int, default=8)
+    parser.add_argument("--products", type=int, default=60)
+    parser.add_argument("--menus", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=2023)
+    parser.add_argument("--json", action="store_true", help="machine readable output")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    timer, wall = result["timer"], result["wall"]
+
+    if args.json:
+        print(json.dumps({
+            "wall": wall,
+            "operations": {
+                name: {
+                    "count": len(values),
+                    "errors": timer.errors.get(name, 0),
+                    "throughput": len(values) / wall,
+                    **{
+                        f"p{p}": percentile(values, p)
+                        for p in (50, 90, 99)
+                    }
+                }
+                for name, values in timer.samples.items()
+            }
+        }))
+    else:
+        print(f"{args.tills} tills x {args.orders} orders, {args.kitchens} kitchen screens, {wall:.2f} s")
+        print(timer.report(wall))
+
+
+if __name__ == "__main__":
+    main()
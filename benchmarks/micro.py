@@ -0,0 +1,181 @@
+"""
+Micro-benchmarks for the order validation and assembly functions.
+
+Each function runs against an in-memory SQLite database seeded with
+catalogs of different sizes, with orders of different sizes, and reports
+the median time and the number of queries per call:
+
+    python -m benchmarks.micro
+    python -m benchmarks.micro --catalog 50,500 --lines 1,10,50 --repeat 20
+    python -m benchmarks.micro --only check_menu,group_products
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+
+from .common import Catalog, close_db, init_db, now, product_line, random_order, seed
+
+from backend.database import Orders, QueryRecorder, Users
+from backend.plugins.orders import (
+    CreateOrdersItem,
+    OrderInfoItem,
+    ProductLineItem,
+    add_products,
+    check_menu,
+    check_product,
+    group_products,
+)
+from backend.utils import remove_equal_dictionaries
+
+
+ROLE = "sagra"
+
+
+def order_lines(rng: random.Random, catalog: Catalog, lines: int) -> CreateOrdersItem:
+    return CreateOrdersItem.parse_obj(
+        random_order(rng, catalog, products=lines, menus=lines)
+    )
+
+
+def bench_remove_equal_dictionaries(rng, catalog, lines):
+    data = [
+        {"product": rng.randint(0, lines), "optional": rng.random() < 0.5}
+        for _ in range(lines * 2)
+    ]
+    return lambda: remove_equal_dictionaries(data)
+
+
+def bench_validate_info(rng, catalog, lines):
+    info = random_order(rng, catalog, 0, 0)["info"]
+    return lambda: OrderInfoItem.parse_obj(info)
+
+
+def bench_validate_order(rng, catalog, lines):
+    # the whole body of POST /orders/: lines products and lines menus
+    payload = random_order(rng, catalog, products=lines, menus=lines)
+    return lambda: CreateOrdersItem.parse_obj(payload)
+
+
+def bench_check_product(rng, catalog, lines):
+    products = order_lines(rng, catalog, lines).product
+    return lambda: check_product(products, ROLE)
+
+
+def bench_check_menu(rng, catalog, lines):
+    menus = order_lines(rng, catalog, lines).menu
+    return lambda: check_menu(menus, ROLE)
+
+
+def bench_add_products(rng, catalog, lines):
+    products = [
+        (None, ProductLineItem.parse_obj(
+            product_line(rng, catalog, rng.choice(list(catalog.products)))
+        ))
+        for _ in range(lines)
+    ]
+
+    async def run():
+        user = await Users.get(username="admin")
+        order = await Orders.create(
+            client="bench",
+            take_away=False,
+            user=user
+        )
+        await add_products(products, order)
+
+    return run
+
+
+def bench_group_products(rng, catalog, lines):
+    data = [
+        (
+            rng.choice(["foods", "drinks"]),
+            rng.randint(0, 8),
+            {"name": f"product {x}", "price": 1.0}
+        )
+        for x in range(lines)
+    ]
+    return lambda: group_products(data)
+
+
+BENCHMARKS = {
+    "remove_equal_dictionaries": bench_remove_equal_dictionaries,
+    "validate_info": bench_validate_info,
+    "validate_order": bench_validate_order,
+    "check_product": bench_check_product,
+    "check_menu": bench_check_menu,
+    "add_products": bench_add_products,
+    "group_products": bench_group_products,
+}
+
+
+async def measure(func, repeat: int):
+    times, queries = [], []
+
+    for _ in range(repeat):
+        with QueryRecorder() as rec:
+            start = now()
+            result = func()
+            if asyncio.iscoroutine(result):
+                await result
+            times.append(now() - start)
+        queries.append(rec.count)
+
+    return statistics.median(times), statistics.median(queries)
+
+
+async def run(args):
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    rows = []
+
+    for size in args.catalog:
+        rng = random.Random(args.seed)
+
+        await init_db()
+        try:
+            catalog = await seed(
+                rng,
+                products=size,
+                menus=max(1, size // 6),
+                tills=1,
+                roles=[ROLE]
+            )
+
+            for name in names:
+                for lines in args.lines:
+                    func = BENCHMARKS[name](rng, catalog, lines)
+                    median, queries = await measure(func, args.repeat)
+                    rows.append((name, size, lines, median, queries))
+        finally:
+            await close_db()
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sizes = lambda x: [int(y) for y in x.split(",")]
+    parser.add_argument("--catalog", type=sizes, default=[20, 200], help="products in the catalog")
+    parser.add_argument("--lines", type=sizes, default=[1, 5, 20], help="lines per order")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=2023)
+    parser.add_argument("--only", default="", help="comma separated benchmarks")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+
+    print(
+        f"{'benchmark':<28}{'catalog':>9}{'lines':>7}"
+        f"{'median us':>12}{'us/line':>10}{'queries':>9}"
+    )
+    for name, size, lines, median, queries in rows:
+        print(
+            f"{name:<28}{size:>9}{lines:>7}"
+            f"{median * 1e6:>12.1f}{median * 1e6 / lines:>10.1f}{queries:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
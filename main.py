@@ -1,21 +1,45 @@
+import asyncio
+import logging
 import secrets
 import string
+import time
 
-from argon2 import PasswordHasher
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
+from backend.catalog import preload as preload_catalog
 from backend.config import Config, Session
-from backend.database import Users, init_db
-from backend.utils import UnicornException
+from backend.database import (
+    QueryLogMiddleware, 
+    Users, 
+    add_query_listener, 
+    init_db,
+    open_pool
+)
+from backend.utils import UnicornException, hash_password
+from backend.utils.metrics import (
+    STARTUP_TIME,
+    MetricsMiddleware, 
+    monitor_event_loop, 
+    record_query
+)
+
+
+started = time.monotonic()
 
 # env 
 load_dotenv()
 
 
+# log: uvicorn configures only its own loggers
+logging.basicConfig(format="%(levelname)s:     %(name)s - %(message)s")
+logging.getLogger("festival").setLevel(logging.INFO)
+log = logging.getLogger("festival.startup")
+
+
 # config
 conf = Session.config = Config()
 
@@ -37,13 +61,34 @@ app.add_middleware(
 )
 
 
+# metrics
+app.add_middleware(MetricsMiddleware)
+add_query_listener(record_query)
+
+if conf.QUERY_DEBUG:
+    app.add_middleware(QueryLogMiddleware)
+
+
 # plugins
-from backend.plugins import auth, menu, orders, products, subcategories, users
+from backend.plugins import (
+    auth, 
+    catalog, 
+    menu, 
+    metrics, 
+    orders, 
+    products, 
+    ready,
+    subcategories, 
+    users
+)
 
 app.include_router(auth.router)
+app.include_router(catalog.router)
 app.include_router(menu.router)
+app.include_router(metrics.router)
 app.include_router(orders.router)
 app.include_router(products.router)
+app.include_router(ready.router)
 app.include_router(subcategories.router)
 app.include_router(users.router)
 
@@ -60,7 +105,8 @@ async def unicorn_exception_handler(_: Request, exc: UnicornException):
         content={
             "error": True,
             "message": exc.message
-        }
+        },
+        headers=exc.headers
     )
 
 
@@ -69,7 +115,7 @@ async def validation_exception_handler(_: Request, exc: RequestValidationError):
     detail = exc.errors()
     message = "Error in:\n"
     message += "\n".join([
-        f"{' -> '.join(x['loc'])}:\n    {x['msg']}" 
+        f"{' -> '.join(map(str, x['loc']))}:\n    {x['msg']}" 
         for x in detail
     ])
 
@@ -84,19 +130,65 @@ async def validation_exception_handler(_: Request, exc: RequestValidationError):
 
 
 # creation admin user if not exist
-@app.on_event("startup")
-async def startup_event():
+async def create_admin():
     if not await Users.filter(role="admin").exists():
         alphabet = string.ascii_letters + string.digits
         password = "".join(secrets.choice(alphabet) for _ in range(8))
 
-        ph = PasswordHasher()
-
         await Users(
             username="admin",
-            password=ph.hash(password),
+            password=await hash_password(password),
             role="admin"
         ).save()
 
         print("Username: admin")
         print("Password:", password)
+
+
+# warm-up: requests are served at once, /ready answers when it is done
+WARM_UP_RETRY = 1
+WARM_UP_MAX_RETRY = 30
+
+
+async def warm_up():
+    # e.g. the database is still starting: retry until the shutdown
+    delay = WARM_UP_RETRY
+    while True:
+        try:
+            await open_pool()
+            await create_admin()
+            await preload_catalog(conf.ROLES)
+            break
+
+        except Exception as e:
+            log.warning("Warm-up failed: %r, retry in %g s", e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARM_UP_MAX_RETRY)
+
+    app.state.startup_time = time.monotonic() - started
+    STARTUP_TIME.set(app.state.startup_time)
+    app.state.ready = True
+
+    log.info("Ready in %.2f s", app.state.startup_time)
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    app.state.ready = False
+    app.state.warm_up = asyncio.create_task(warm_up())
+
+
+@app.on_event("shutdown")
+async def stop_warm_up():
+    app.state.warm_up.cancel()
+
+
+# event loop lag monitor
+@app.on_event("startup")
+async def start_loop_monitor():
+    app.state.loop_monitor = asyncio.create_task(monitor_event_loop())
+
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    app.state.loop_monitor.cancel()
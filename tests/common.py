@@ -0,0 +1,15 @@
+import httpx
+
+from benchmarks.common import PASSWORD
+
+
+ROLE = "sagra"
+
+
+async def login(client: httpx.AsyncClient, username: str) -> dict:
+    r = await client.get(
+        "/auth/",
+        params={"username": username, "password": PASSWORD}
+    )
+
+    return {"Authorization": f"Bearer {r.json()['token']}"}
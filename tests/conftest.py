@@ -0,0 +1,38 @@
+import random
+
+import httpx
+import pytest
+
+from backend.catalog import preload
+from benchmarks.common import close_db, init_db, seed
+
+import main
+
+from .common import ROLE
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def catalog():
+    # a fresh in-memory database with the benchmark catalog, its views
+    # built as by the warm-up at startup
+    await init_db()
+    try:
+        seeded = await seed(random.Random(2023), tills=1, roles=[ROLE])
+        await preload([ROLE])
+        yield seeded
+    finally:
+        await close_db()
+
+
+@pytest.fixture
+async def client(catalog):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=main.app),
+        base_url="http://test"
+    ) as c:
+        yield c
@@ -0,0 +1,129 @@
+"""
+Admission control: above its concurrency and queue a limiter answers
+503 with Retry-After, and a slot is given back however the request ends.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+
+from backend.config import Session
+from backend.utils import UnicornException
+from backend.utils.admission import Limiter
+
+import main
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    # one running, one waiting
+    monkeypatch.setattr(Session.config, "ORDERS_CONCURRENCY", 1)
+    monkeypatch.setattr(Session.config, "ORDERS_QUEUE", 1)
+    monkeypatch.setattr(Session.config, "ADMISSION_RETRY_AFTER", 1.5)
+
+    return Limiter("test", "ORDERS")
+
+
+@pytest.fixture
+def release():
+    return asyncio.Event()
+
+
+@pytest.fixture
+async def client(limiter, release):
+    app = FastAPI()
+    app.add_exception_handler(UnicornException, main.unicorn_exception_handler)
+
+    @app.get("/slow", dependencies=[Depends(limiter)])
+    async def slow():
+        await release.wait()
+        return {"error": False, "message": ""}
+
+    @app.get("/fast", dependencies=[Depends(limiter)])
+    async def fast():
+        return {"error": False, "message": ""}
+
+    @app.get("/refused", dependencies=[Depends(limiter)])
+    async def refused():
+        raise UnicornException(status=406, message="No data")
+
+    @app.get("/broken", dependencies=[Depends(limiter)])
+    async def broken():
+        raise RuntimeError("broken")
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://test"
+    ) as c:
+        yield c
+
+
+async def done(request) -> httpx.Response:
+    # a slot never given back would hang the test
+    return await asyncio.wait_for(request, 5)
+
+
+async def until(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+    raise AssertionError("condition not reached")
+
+
+def free(limiter: Limiter) -> bool:
+    return not limiter._semaphore.locked() and limiter.waiting == 0
+
+
+async def test_rejected_above_queue(client, limiter, release):
+    running = asyncio.create_task(client.get("/slow"))
+    await until(lambda: limiter._semaphore is not None and limiter._semaphore.locked())
+    waiting = asyncio.create_task(client.get("/slow"))
+    await until(lambda: limiter.waiting == 1)
+
+    r = await client.get("/fast")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "2"
+    assert r.json()["error"] is True
+
+    release.set()
+    assert (await done(running)).status_code == 200
+    assert (await done(waiting)).status_code == 200
+    assert free(limiter)
+
+    assert (await done(client.get("/fast"))).status_code == 200
+
+
+async def test_released_on_error(client, limiter):
+    assert (await client.get("/refused")).status_code == 406
+    assert free(limiter)
+
+    with pytest.raises(RuntimeError):
+        await client.get("/broken")
+    assert free(limiter)
+
+    assert (await done(client.get("/fast"))).status_code == 200
+
+
+async def test_released_on_disconnect(client, limiter):
+    running = asyncio.create_task(client.get("/slow"))
+    await until(lambda: limiter._semaphore is not None and limiter._semaphore.locked())
+    waiting = asyncio.create_task(client.get("/slow"))
+    await until(lambda: limiter.waiting == 1)
+
+    # the client waiting for a slot goes away: it leaves the queue
+    waiting.cancel()
+    await until(lambda: limiter.waiting == 0)
+    assert limiter._semaphore.locked()
+
+    # the client holding it goes away: the slot is given back
+    running.cancel()
+    await until(lambda: free(limiter))
+
+    assert (await done(client.get("/fast"))).status_code == 200
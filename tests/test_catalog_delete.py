@@ -0,0 +1,85 @@
+"""
+The menus left after deleting products: a menu made only of deleted
+products goes away, a menu that only loses some of them stays.
+"""
+
+import pytest
+
+from backend import catalog
+from backend.database import Menu, MenuProduct, Products, Subcategories
+
+from .common import login
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def make_menus():
+    # pasta, sauce in a new subcategory, wine elsewhere
+    sub = await Subcategories.create(name="primi", order=100)
+    other = await Subcategories.create(name="bevande", order=101)
+    pasta, sauce, wine = [
+        await Products.create(name=name, price=5, category="foods", subcategory=s)
+        for name, s in (("pasta", sub), ("sauce", sub), ("wine", other))
+    ]
+
+    menus = {}
+    for name, products in (
+        ("only pasta", [pasta]),
+        ("pasta and wine", [pasta, wine]),
+        ("pasta and sauce", [pasta, sauce]),
+    ):
+        menu = menus[name] = await Menu.create(name=name)
+        await MenuProduct.bulk_create([
+            MenuProduct(menu=menu, product=x) for x in products
+        ])
+
+    # logged as the routes do, so the delete shows up as a delta
+    await catalog.record_changes(
+        catalog.MENU,
+        catalog.INSERT,
+        [x.id for x in menus.values()]
+    )
+
+    return sub, (pasta, sauce, wine), menus
+
+
+async def menu_products(menu: Menu):
+    return set(await MenuProduct.filter(menu=menu).values_list(
+        "product_id",
+        flat=True
+    ))
+
+
+async def test_delete_product(client):
+    headers = await login(client, "admin")
+    _, (pasta, sauce, wine), menus = await make_menus()
+    version = (await client.get("/catalog/changes?since=0", headers=headers)).json()["version"]
+
+    r = await client.delete(f"/products/{pasta.id}", headers=headers)
+    assert r.json()["error"] is False
+
+    assert not await Menu.exists(id=menus["only pasta"].id)
+    assert await menu_products(menus["pasta and wine"]) == {wine.id}
+    assert await menu_products(menus["pasta and sauce"]) == {sauce.id}
+
+    changes = (await client.get(f"/catalog/changes?since={version}", headers=headers)).json()
+    assert changes["menus"]["delete"] == [menus["only pasta"].id]
+    assert {x["id"] for x in changes["menus"]["upsert"]} == {
+        menus["pasta and wine"].id,
+        menus["pasta and sauce"].id
+    }
+
+
+async def test_delete_subcategory(client):
+    headers = await login(client, "admin")
+    sub, (pasta, sauce, wine), menus = await make_menus()
+
+    r = await client.delete(f"/subcategories/{sub.id}", headers=headers)
+    assert r.json()["error"] is False
+
+    assert not await Products.exists(id__in=[pasta.id, sauce.id])
+    assert not await Menu.exists(
+        id__in=[menus["only pasta"].id, menus["pasta and sauce"].id]
+    )
+    assert await menu_products(menus["pasta and wine"]) == {wine.id}
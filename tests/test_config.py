@@ -0,0 +1,46 @@
+"""
+The database settings reach the driver as they are written in the .env.
+"""
+
+from backend.config import Config
+from backend.database import tortoise_config
+
+
+def settings(**kwargs) -> Config:
+    return Config(
+        JWT_SECRET="secret",
+        JWT_TOKEN_EXPIRES=60,
+        **kwargs
+    )
+
+
+def test_postgres_credentials():
+    conf = settings(
+        DB_URL="",
+        DB_USERNAME="fest@ival",
+        PASSWORD="p@ss:/w#rd%20",
+        HOST="db.local",
+        PORT="5433",
+        DB_NAME="sagra/2023"
+    )
+    default = tortoise_config(conf.db, 2, 8)["connections"]["default"]
+
+    assert default["engine"] == "tortoise.backends.asyncpg"
+    assert default["credentials"] == {
+        "host": "db.local",
+        "port": 5433,
+        "user": "fest@ival",
+        "password": "p@ss:/w#rd%20",
+        "database": "sagra/2023",
+        "minsize": 2,
+        "maxsize": 8
+    }
+
+
+def test_db_url():
+    conf = settings(DB_URL="sqlite://festival.sqlite3")
+    default = tortoise_config(conf.db)["connections"]["default"]
+
+    assert default["engine"] == "tortoise.backends.sqlite"
+    assert default["credentials"]["file_path"] == "festival.sqlite3"
+    assert default["credentials"]["journal_mode"] == "WAL"
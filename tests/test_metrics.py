@@ -0,0 +1,39 @@
+"""
+/metrics: read by the admins, or by the scraper with METRICS_TOKEN.
+"""
+
+import pytest
+
+from backend.config import Session
+
+from .common import login
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_admin_only(client):
+    assert (await client.get("/metrics/")).status_code == 422
+
+    headers = await login(client, "till0")
+    assert (await client.get("/metrics/", headers=headers)).status_code == 403
+
+    headers = await login(client, "admin")
+    r = await client.get("/metrics/", headers=headers)
+    assert r.status_code == 200
+    assert "festival_" in r.text
+
+
+async def test_scrape_token(client, monkeypatch):
+    monkeypatch.setattr(Session.config, "METRICS_TOKEN", "scrape-secret")
+
+    r = await client.get("/metrics/", headers={"Authorization": "Bearer scrape-secret"})
+    assert r.status_code == 200
+
+    r = await client.get("/metrics/", headers={"Authorization": "Bearer wrong"})
+    assert r.status_code == 401
+
+    # without a scrape token no bearer gets in but an admin one
+    monkeypatch.setattr(Session.config, "METRICS_TOKEN", "")
+    r = await client.get("/metrics/", headers={"Authorization": "Bearer "})
+    assert r.status_code == 401
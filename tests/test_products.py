@@ -0,0 +1,36 @@
+"""
+The variant and ingredient bodies are strict: no coercion, no extra keys.
+"""
+
+import pytest
+
+from .common import login
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("route", ["variant", "ingredient"])
+async def test_price_item(client, catalog, route):
+    headers = await login(client, "admin")
+    product = list(catalog.products)[0]
+    url = f"/products/{product}/{route}"
+
+    for body in (
+        {"name": "extra", "price": "1.5"},
+        {"name": 2, "price": 1},
+        {"name": "extra", "price": 1, "stock": 3},
+        {"name": "extra"},
+    ):
+        r = await client.post(url, json=body, headers=headers)
+        assert r.status_code == 422, body
+        assert r.json()["error"] is True
+
+    r = await client.post(url, json={"name": "extra", "price": -1}, headers=headers)
+    assert r.status_code == 406
+
+    # an int price is a price
+    r = await client.post(url, json={"name": "extra", "price": 1}, headers=headers)
+    assert r.json()["error"] is False
+    r = await client.post(url, json={"name": "large", "price": 1.5}, headers=headers)
+    assert r.json()["error"] is False
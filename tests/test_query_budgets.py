@@ -0,0 +1,135 @@
+"""
+Query budgets of the hot handlers: a loop that issues a statement per
+item fails here with the report of the repeated statement shapes.
+"""
+
+import random
+
+import pytest
+
+from benchmarks.common import random_order
+from backend.catalog import invalidate
+from backend.database import (
+    IngredientOrder,
+    MenuOrder,
+    ProductOrder,
+    QueryRecorder
+)
+from backend.plugins.orders import CreateOrdersItem, check_menu, check_product
+
+from .common import ROLE, login
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_get_products(client):
+    headers = await login(client, "till0")
+
+    with QueryRecorder() as rec:
+        r = await client.get("/products/", headers=headers)
+
+    assert r.status_code == 200
+    rec.assert_budget(2, max_repeats=1)
+
+
+async def test_get_order(client, catalog):
+    headers = await login(client, "till0")
+    order = random_order(random.Random(1), catalog, products=5, menus=3)
+    order_id = (await client.post("/orders/", json=order, headers=headers)).json()["order_id"]
+
+    with QueryRecorder() as rec:
+        r = await client.get(f"/orders/{order_id}", headers=headers)
+
+    assert r.status_code == 200
+    rec.assert_budget(7, max_repeats=1)
+
+
+async def test_check_product_and_menu(catalog):
+    item = CreateOrdersItem.parse_obj(
+        random_order(random.Random(1), catalog, products=20, menus=10)
+    )
+
+    # cold: the price and menu indexes are loaded, whatever the lines
+    invalidate()
+    with QueryRecorder() as rec:
+        assert await check_product(item.product, ROLE)
+        assert await check_menu(item.menu, ROLE)
+    rec.assert_budget(7, max_repeats=1)
+
+    with QueryRecorder() as rec:
+        assert await check_product(item.product, ROLE)
+        assert await check_menu(item.menu, ROLE)
+    rec.assert_budget(0)
+
+
+async def test_add_menu(client, catalog):
+    headers = await login(client, "admin")
+    products = list(catalog.products)[:10]
+
+    with QueryRecorder() as rec:
+        r = await client.post(
+            "/menu/",
+            json={
+                "name": "new menu",
+                "products": [
+                    {"product": x, "optional": i > 1}
+                    for i, x in enumerate(products)
+                ],
+                "roles": [ROLE]
+            },
+            headers=headers
+        )
+
+    assert r.json()["error"] is False
+    rec.assert_budget(7, max_repeats=1)
+
+
+async def test_add_product(client):
+    headers = await login(client, "admin")
+
+    with QueryRecorder() as rec:
+        r = await client.post(
+            "/products/",
+            json={
+                "name": "new product",
+                "price": 2,
+                "category": "foods",
+                "subcategory": 1,
+                "roles": [ROLE],
+                "variant": [{"name": f"variant {x}", "price": 1} for x in range(5)],
+                "ingredients": [{"name": f"ingredient {x}", "price": 1} for x in range(5)]
+            },
+            headers=headers
+        )
+
+    assert r.json()["error"] is False
+    rec.assert_budget(8, max_repeats=1)
+
+
+async def test_create_orders(client, catalog):
+    headers = await login(client, "till0")
+    order = random_order(random.Random(1), catalog, products=5, menus=3)
+
+    with QueryRecorder() as rec:
+        r = await client.post("/orders/", json=order, headers=headers)
+
+    assert r.json()["error"] is False
+    rec.assert_budget(10, max_repeats=1)
+
+    # the rows read back in insert order got the right menus and ingredients
+    order_id = r.json()["order_id"]
+    lines = order["product"] + [y for x in order["menu"] for y in x["products"]]
+    menus = dict(await MenuOrder.filter(order_id=order_id).values_list("id", "menu_id"))
+    rows = await ProductOrder.filter(order_id=order_id).order_by("id")
+
+    assert [x.product_id for x in rows] == [x["id"] for x in lines]
+    assert [menus.get(x.menu_id) for x in rows] == (
+        [None] * len(order["product"]) + 
+        [x["id"] for x in order["menu"] for _ in x["products"]]
+    )
+    for row, line in zip(rows, lines):
+        assert sorted(await IngredientOrder.filter(product=row).values_list(
+            "ingredient_id", 
+            flat=True
+        )) == sorted(line["ingredient"])
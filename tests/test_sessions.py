@@ -0,0 +1,121 @@
+"""
+Login sessions: a refresh token is used up by the refresh, using it again
+ends the session, and the revoked sessions stop their access tokens.
+"""
+
+import pytest
+
+from benchmarks.common import PASSWORD
+from backend.database import LoginSession
+from backend.utils import session_cache
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def open_session(client, username: str, password: str = PASSWORD) -> dict:
+    r = await client.get(
+        "/auth/",
+        params={"username": username, "password": password}
+    )
+    assert r.json()["error"] is False
+
+    return r.json()
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def authorized(client, tokens: dict) -> bool:
+    r = await client.get("/products/", headers=bearer(tokens["token"]))
+    assert r.status_code in (200, 401)
+
+    return r.status_code == 200
+
+
+async def test_refresh_rotation(client):
+    tokens = await open_session(client, "till0")
+
+    r = await client.post("/auth/refresh", headers=bearer(tokens["refresh_token"]))
+    assert r.json()["error"] is False
+    rotated = r.json()
+
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert await authorized(client, rotated)
+    # the same session: the access token issued before still works
+    assert await authorized(client, tokens)
+
+    # the new refresh token rotates again
+    r = await client.post("/auth/refresh", headers=bearer(rotated["refresh_token"]))
+    assert r.json()["error"] is False
+
+
+async def test_refresh_reuse(client):
+    tokens = await open_session(client, "till0")
+
+    r = await client.post("/auth/refresh", headers=bearer(tokens["refresh_token"]))
+    rotated = r.json()
+
+    # the old refresh token again: it leaked, the session ends
+    r = await client.post("/auth/refresh", headers=bearer(tokens["refresh_token"]))
+    assert r.status_code == 401
+    assert await LoginSession.filter(revoked=True).count() == 1
+
+    assert not await authorized(client, rotated)
+    r = await client.post("/auth/refresh", headers=bearer(rotated["refresh_token"]))
+    assert r.status_code == 401
+
+
+async def test_refresh_with_access_token(client):
+    tokens = await open_session(client, "till0")
+
+    r = await client.post("/auth/refresh", headers=bearer(tokens["token"]))
+    assert r.status_code == 400
+
+
+async def test_logout(client):
+    tokens = await open_session(client, "till0")
+    other = await open_session(client, "till0")
+
+    r = await client.delete("/auth/", headers=bearer(tokens["token"]))
+    assert r.json()["error"] is False
+
+    assert not await authorized(client, tokens)
+    r = await client.post("/auth/refresh", headers=bearer(tokens["refresh_token"]))
+    assert r.status_code == 401
+
+    # only the session of the token
+    assert await authorized(client, other)
+
+    # revoked on the database too, not only in the cache
+    session_cache.clear()
+    assert not await authorized(client, tokens)
+    assert await authorized(client, other)
+
+
+async def test_change_password(client):
+    current = await open_session(client, "till0")
+    other = await open_session(client, "till0")
+    admin = await open_session(client, "admin")
+
+    r = await client.put(
+        "/users/",
+        json={"password": "new password"},
+        headers=bearer(current["token"])
+    )
+    assert r.json()["error"] is False
+
+    # the other devices of the user login again, the one that changed it
+    # and the other users stay
+    assert await authorized(client, current)
+    assert not await authorized(client, other)
+    assert await authorized(client, admin)
+
+    session_cache.clear()
+    assert await authorized(client, current)
+    assert not await authorized(client, other)
+
+    r = await client.get("/auth/", params={"username": "till0", "password": PASSWORD})
+    assert r.status_code == 404
+    await open_session(client, "till0", "new password")
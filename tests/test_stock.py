@@ -0,0 +1,111 @@
+"""
+Tracked stock: an order takes its units, the order that finds an item
+sold out gets a 409 and writes nothing, and the existing databases get
+the stock columns at startup.
+"""
+
+import pytest
+from tortoise import connections
+
+from backend.catalog import PRODUCT, UPDATE
+from backend.database import (
+    CatalogChange,
+    Ingredients,
+    Orders,
+    Products,
+    upgrade_schema
+)
+
+from .common import login
+
+
+pytestmark = pytest.mark.anyio
+
+
+def order(product: int, quantity: int, ingredient: tuple = ()) -> dict:
+    return {
+        "info": {"client": "stock test", "take_away": True},
+        "product": [{
+            "id": product,
+            "ingredient": list(ingredient),
+            "quantity": quantity
+        }]
+    }
+
+
+def plain_product(catalog) -> int:
+    # no variants: a line without a variant is valid
+    return next(x for x, y in catalog.products.items() if not y["variants"])
+
+
+async def test_order_takes_stock(client, catalog):
+    headers = await login(client, "till0")
+    product = plain_product(catalog)
+    await Products.filter(id=product).update(stock=3)
+
+    r = await client.post("/orders/", json=order(product, 2), headers=headers)
+    assert r.json()["error"] is False
+    assert (await Products.get(id=product)).stock == 1
+
+    # not at 0 yet: nothing for the tills
+    assert not await CatalogChange.filter(entity=PRODUCT).exists()
+
+
+async def test_sold_out(client, catalog):
+    headers = await login(client, "till0")
+    product = plain_product(catalog)
+    await Products.filter(id=product).update(stock=2)
+
+    r = await client.post("/orders/", json=order(product, 2), headers=headers)
+    assert r.json()["error"] is False
+    assert (await Products.get(id=product)).stock == 0
+    assert await CatalogChange.filter(
+        entity=PRODUCT,
+        op=UPDATE,
+        entity_id=product
+    ).exists()
+
+    orders = await Orders.all().count()
+    r = await client.post("/orders/", json=order(product, 1), headers=headers)
+    assert r.status_code == 409
+    assert r.json()["error"] is True
+    assert "sold out" in r.json()["message"]
+
+    # rolled back
+    assert await Orders.all().count() == orders
+    assert (await Products.get(id=product)).stock == 0
+
+
+async def test_ingredient_sold_out(client, catalog):
+    headers = await login(client, "till0")
+    product, ingredient = next(
+        (x, y["ingredients"][0])
+        for x, y in catalog.products.items()
+        if not y["variants"] and y["ingredients"]
+    )
+    await Products.filter(id=product).update(stock=10)
+    await Ingredients.filter(id=ingredient).update(stock=1)
+
+    r = await client.post(
+        "/orders/",
+        json=order(product, 2, (ingredient,)),
+        headers=headers
+    )
+    assert r.status_code == 409
+
+    # the product units taken before the ingredient are given back
+    assert (await Products.get(id=product)).stock == 10
+    assert (await Ingredients.get(id=ingredient)).stock == 1
+
+
+async def test_upgrade_schema(catalog):
+    connection = connections.get("default")
+    await connection.execute_script('ALTER TABLE "products" DROP COLUMN "stock"')
+
+    # twice: the second run finds the column
+    await upgrade_schema(connection)
+    await upgrade_schema(connection)
+
+    _, rows = await connection.execute_query('PRAGMA table_info("products")')
+    assert "stock" in [row["name"] for row in rows]
+    assert await Products.filter(stock__isnull=True).count() == len(catalog.products)